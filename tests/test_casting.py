@@ -7,7 +7,11 @@ from collections import (
     deque,
     Counter
 )
+import abc
+import array
+import itertools
 import json
+import sys
 
 import pytest
 import six
@@ -107,3 +111,420 @@ def test_bad_tuple_Cast():
     """Test that casting a bad tuple raises a TypeError."""
     with pytest.raises(TypeError):
         cast(Tuple[int], [1, 2, 3])
+
+
+def test_cast_registered_abc():
+    """Test that casting to an ABC uses classes registered after a cast."""
+    import abc
+
+    class Base(six.with_metaclass(abc.ABCMeta, object)):
+        pass
+
+    class Impl(object):
+        def __init__(self, value):
+            self.value = value
+
+    with pytest.raises(TypeError):
+        cast(Base, 1)
+    Base.register(Impl)
+    actual = cast(Base, 1)
+    assert isinstance(actual, Impl)
+    assert actual.value == 1
+
+
+_requires_memoryview_cast = pytest.mark.skipif(
+    not hasattr(memoryview, 'cast'),
+    reason='Only floats are compact before Python 3.3.')
+
+
+@pytest.mark.parametrize('type_, expected_type, expected', [
+    pytest.param(Sequence[int], array.array, [1, 2, 3],
+                 marks=_requires_memoryview_cast),
+    (MutableSequence[float], array.array, [1.0, 2.0, 3.0]),
+    pytest.param(Sequence[bool], memoryview, [True, True, True],
+                 marks=_requires_memoryview_cast)
+])
+def test_cast_compact(type_, expected_type, expected):
+    """Test casting numeric sequences to packed buffers."""
+    actual = cast(type_, ['1', '2', '3'], compact=True)
+    assert isinstance(actual, expected_type)
+    assert list(actual) == expected
+    assert is_instance(actual, type_)
+    assert cast(type_, actual, compact=True) is actual
+
+
+def test_cast_compact_unsupported():
+    """Test that compact casts fall back when a buffer cannot be used."""
+    actual = cast(Sequence[int], [2 ** 70], compact=True)
+    assert not isinstance(actual, array.array)
+    assert list(actual) == [2 ** 70]
+    assert cast(List[int], ['1', '2'], compact=True) == [1, 2]
+
+
+def test_cast_compact_typecodes(monkeypatch):
+    """Test that item types without a packed buffer are not compact."""
+    import typingplus
+
+    monkeypatch.setattr(typingplus, '_COMPACT_TYPECODES', {float: 'd'})
+    for type_, obj, expected in ((Sequence[int], ['1', '2'], [1, 2]),
+                                 (Sequence[bool], [1, 0], [True, False])):
+        actual = cast(type_, obj, compact=True)
+        assert not isinstance(actual, (array.array, memoryview))
+        assert list(actual) == expected
+    assert isinstance(
+        cast(Sequence[float], ['1'], compact=True), array.array)
+
+
+@pytest.mark.parametrize('type_', [
+    Iterator[str],
+    Iterable[str],
+    Generator[str, None, None]
+])
+def test_cast_lazy(type_):
+    """Test that casting an unbounded iterator casts items when pulled."""
+    actual = cast(type_, itertools.count())
+    assert [next(actual) for _ in range(3)] == ['0', '1', '2']
+
+
+def test_cast_iterable_eager():
+    """Test that containers cast to Iterable[T] are cast into a list."""
+    actual = cast(Iterable[int], ['1', '2'])
+    assert type(actual) is list
+    assert actual == [1, 2]
+    assert cast(Iterable[int], ('1',)) == [1]
+
+
+def test_cast_lazy_generator_send():
+    """Test that values sent to a cast generator reach the generator."""
+    def func():
+        value = yield 1
+        yield value
+
+    actual = cast(Generator[str, int, None], func())
+    assert next(actual) == '1'
+    assert actual.send(2) == '2'
+
+
+def test_cast_lazy_error():
+    """Test that items that cannot be cast raise when they are pulled."""
+    actual = cast(Iterator[int], iter(['1', 'a']))
+    assert next(actual) == 1
+    with pytest.raises(TypeError):
+        next(actual)
+
+
+def test_is_instance_iterator_not_consumed():
+    """Test that checking an iterator does not consume its items."""
+    iterator = iter([1, 2, 3])
+    is_instance(iterator, Iterator[int])
+    assert list(iterator) == [1, 2, 3]
+
+
+def test_is_instance_cache():
+    """Test that is_instance caches results only for immutable values."""
+    checked = []
+
+    class Meta(type):
+        def __instancecheck__(cls, instance):
+            checked.append(instance)
+            return True
+
+    class Checked(six.with_metaclass(Meta, object)):
+        pass
+
+    frozen = (1, ('a', frozenset([b'b'])), None)
+    mutable = (1, ['a'])
+    for _ in range(2):
+        assert is_instance(frozen, Checked, cache=True)
+        assert is_instance(mutable, Checked, cache=True)
+    assert checked == [frozen, mutable, mutable]
+
+
+def test_is_instance_cache_large():
+    """Test that large objects are not kept alive by the is_instance cache."""
+    large = tuple(range(10000))
+    for _ in range(2):
+        assert is_instance(large, Tuple[int, ...], cache=True)
+    assert sys.getrefcount(large) == 2
+
+
+@pytest.mark.skipif(sys.version_info < (3, 9),
+                    reason='Built-in generic types require Python 3.9.')
+def test_builtin_generics():
+    """Test checking and casting the built-in generic types of PEP 585."""
+    assert is_instance([1, 2], list[int])
+    assert not is_instance([1, '2'], list[int])
+    assert is_instance({'a': (1,)}, dict[str, tuple[int, ...]])
+    assert cast(list[int], ['1', '2']) == [1, 2]
+    assert cast(set[int], ['1', '2']) == {1, 2}
+    assert cast(dict[str, float], {1: '2'}) == {'1': 2.0}
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10),
+                    reason='Union operators require Python 3.10.')
+def test_union_operator():
+    """Test checking and casting the unions of PEP 604."""
+    assert is_instance(None, int | None)
+    assert is_instance(1, int | None)
+    assert not is_instance('1', int | None)
+    assert cast(int | None, '1') == 1
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='The typing backport exposes different origins.')
+def test_special_forms():
+    """Test checking special forms of the typing module."""
+    UserId = NewType('UserId', int)
+    assert is_instance(1, UserId)
+    assert not is_instance('1', UserId)
+    assert is_instance(bool, Type[int])
+    assert not is_instance(str, Type[int])
+    assert is_instance(str, Type[Union[int, str]])
+    assert is_instance(Counter('ab'), Counter[str])
+    assert not is_instance(Counter([1]), Counter[str])
+    assert is_instance((), Tuple[()])
+    assert not is_instance((1,), Tuple[()])
+    assert is_instance((1,), Tuple)
+    if sys.version_info >= (3, 9):
+        assert is_instance((), tuple[()])
+        assert not is_instance((1,), tuple[()])
+
+
+def test_validation_budget_depth():
+    """Test that checking values nested too deeply raises."""
+    type_ = List[List[List[int]]]
+    with validation_budget(max_depth=3):
+        with pytest.raises(BudgetExceededError):
+            is_instance([[[1]]], type_)
+        with pytest.raises(BudgetExceededError):
+            cast(type_, [[['1']]])
+    assert is_instance([[[1]]], type_)
+
+
+def test_validation_budget_cast_depth():
+    """Test that casting a value counts the same depth as checking it."""
+    with validation_budget(max_depth=3):
+        assert is_instance([[1]], List[List[int]])
+        assert is_instance([[1]], Optional[List[List[int]]])
+        assert cast(List[List[int]], [['1']]) == [[1]]
+        assert cast(Optional[List[List[int]]], [['1']]) == [[1]]
+    with validation_budget(max_depth=1):
+        assert is_instance(5, int, cache=True)
+    with validation_budget(max_depth=2):
+        for _ in range(2):
+            assert is_instance((1,), Tuple[int], cache=True)
+
+
+def test_validation_budget_items():
+    """Test that checking or casting too many values raises."""
+    with validation_budget(max_items=100):
+        assert is_instance(list(range(50)), List[int])
+        with pytest.raises(BudgetExceededError):
+            cast(List[int], [str(i) for i in range(100)])
+
+
+def test_validation_budget_timeout():
+    """Test that checking values after the timeout raises."""
+    with validation_budget(timeout=-1):
+        with pytest.raises(BudgetExceededError):
+            is_instance([1], List[int])
+
+
+@pytest.mark.parametrize('has_recursion_error', [True, False])
+def test_cast_candidate_runtime_errors(monkeypatch, has_recursion_error):
+    """Test that only recursion errors from candidates are raised."""
+    import typingplus
+
+    if not has_recursion_error:  # As in Python 2.
+        monkeypatch.setattr(typingplus, '_RecursionError', None)
+    elif typingplus._RecursionError is None:
+        pytest.skip('RecursionError requires Python 3.5.')
+
+    class NotImplemented_(object):
+        def __init__(self, value):
+            raise NotImplementedError
+
+    class Recursive(object):
+        def __init__(self, value):
+            raise (typingplus._RecursionError or RuntimeError)(
+                'maximum recursion depth exceeded')
+
+    assert cast(Union[NotImplemented_, int], '1') == 1
+    with pytest.raises(RuntimeError):
+        cast(Union[Recursive, int], '1')
+
+
+def _callback(value, name, flag=None):
+    # type: (int, str, bool) -> bool
+    return True
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='The typing backport exposes different origins.')
+@pytest.mark.parametrize('type_, expected', [
+    (Callable[[int, str], bool], True),
+    (Callable[[int, str, bool], int], True),
+    (Callable[[bool, str], bool], True),
+    (Callable[..., bool], True),
+    (Callable[[int], bool], False),
+    (Callable[[int, str, bool, int], bool], False),
+    (Callable[[str, str], bool], False),
+    (Callable[[int, str], str], False)
+] + ([
+    (Callable[ParamSpec('P'), bool], True),
+    (Callable[Concatenate[int, ParamSpec('P')], bool], True),
+    (Callable[Concatenate[str, ParamSpec('P')], bool], False),
+    (Callable[Concatenate[int, str, bool, int, ParamSpec('P')], bool], False)
+] if sys.version_info >= (3, 10) else []))
+def test_is_instance_signature(type_, expected):
+    """Test checking callables against the arguments of Callable types."""
+    assert is_instance(_callback, type_)
+    assert is_instance(_callback, type_, check_signature=True) is expected
+    assert is_instance(
+        {'a': _callback}, Dict[str, type_], check_signature=True) is expected
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='The typing backport exposes different origins.')
+def test_is_instance_signature_cached(monkeypatch):
+    """Test that signature checks are cached per function and type."""
+    import typingplus
+
+    def func(value):
+        # type: (int) -> int
+        return value
+
+    calls = []
+    get_type_hints = typingplus.get_type_hints
+
+    def _get_type_hints(obj, *args, **kwargs):
+        calls.append(obj)
+        return get_type_hints(obj, *args, **kwargs)
+
+    monkeypatch.setattr(typingplus, 'get_type_hints', _get_type_hints)
+    for _ in range(3):
+        assert is_instance(func, Callable[[int], int], check_signature=True)
+        assert not is_instance(func, Callable[[str], int],
+                               check_signature=True)
+    assert calls == [func, func]
+
+
+class _Port(object):
+    """A class that can only be created from numeric values."""
+
+    def __init__(self, value):
+        self.value = int(value)
+
+
+def test_cast_specialized():
+    """Test that the candidate that cast a value is learned and reused."""
+    stats = get_cast_stats()
+    assert [cast(_Port, str(i)).value for i in range(3)] == [0, 1, 2]
+    learned = get_cast_stats()
+    assert learned['specializations'] == stats['specializations'] + 1
+    assert learned['hits'] == stats['hits'] + 2
+    with pytest.raises(TypeError):
+        cast(_Port, 'port')
+    assert get_cast_stats()['misses'] == learned['misses'] + 1
+    assert cast(_Port, '8080').value == 8080
+
+
+def test_cast_specialized_fallback():
+    """Test that values the learned candidate fails on are still cast."""
+    assert cast(Union[int, float], '1') == 1
+    stats = get_cast_stats()
+    assert cast(Union[int, float], '1.5') == 1.5
+    assert get_cast_stats()['misses'] == stats['misses'] + 1
+    assert cast(Union[int, float], '2') == 2
+
+
+def test_cast_specialized_deopt():
+    """Test that a learned candidate that keeps failing is dropped."""
+    class Temperature(float):
+        pass
+
+    assert cast(Temperature, '1') == 1.0
+    stats = get_cast_stats()
+    for _ in range(8):
+        with pytest.raises(TypeError):
+            cast(Temperature, 'hot')
+    deopted = get_cast_stats()
+    assert deopted['deopts'] == stats['deopts'] + 1
+    assert deopted['active'] == stats['active'] - 1
+    assert cast(Temperature, '2') == 2.0
+    assert get_cast_stats()['active'] == stats['active']
+
+
+def test_cast_specialized_register():
+    """Test that learned candidates are dropped when a class is registered."""
+    @six.add_metaclass(abc.ABCMeta)
+    class Base(object):
+        def __init__(self, value):
+            self.value = value
+
+    actual = cast(Base, 'x')
+    assert isinstance(actual, Base) and actual.value == 'x'
+    assert isinstance(cast(Base, 'x'), Base)
+    Base.register(six.text_type)
+    assert cast(Base, 'y') == 'y'
+
+
+def test_cast_not_specialized():
+    """Test that casts that depend on the value are not learned."""
+    assert cast(List[int], [1]) == [1]
+    assert cast(List[int], ['1']) == [1]
+    assert cast(Union[int, float], '1.5') == 1.5
+    assert cast(Union[int, float], '1') == 1
+
+
+def test_cast_counter():
+    """Test that casting to Counter[T] casts the keys and keeps the counts."""
+    actual = cast(Counter[str], {1: 2, 2: 3})
+    assert actual == Counter({'1': 2, '2': 3})
+    assert isinstance(actual, Counter)
+    assert cast(Counter[str], ['a', 'b', 'a']) == Counter({'a': 2, 'b': 1})
+
+
+@pytest.mark.parametrize('type_, obj, expected', [
+    (Set[frozenset], [[1]], {frozenset([1])}),
+    (FrozenSet[int], ['1', '2'], frozenset([1, 2])),
+    (Deque[list], [(1,)], deque([[1]])),
+    (Tuple[int, ...], ['1', '2'], (1, 2)),
+    (Tuple[int, str], ['1', 2], (1, '2')),
+    (Sequence[bool], [1, 0], (True, False)),
+] + ([
+    (Collection[int], ['1'], [1]),
+] if sys.version_info >= (3, 6) else []))
+def test_cast_container_type(type_, obj, expected):
+    """Test that items are cast into the container of the type."""
+    result = cast(type_, obj)
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='The typing backport exposes different origins.')
+def test_is_instance_signature_cached_closures():
+    """Test that functions sharing a code object are checked separately."""
+    def make(type_):
+        def func(value):
+            return value
+        func.__annotations__ = {'value': type_}
+        return func
+
+    type_ = Callable[[int], int]
+    assert is_instance(make(int), type_, check_signature=True)
+    assert not is_instance(make(str), type_, check_signature=True)
+    assert is_instance(make(int), type_, check_signature=True)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='The typing backport exposes different origins.')
+def test_is_instance_signature_identity_cache():
+    """Test that signatures are checked when results are cached."""
+    type_ = Tuple[Callable[[str, str], bool]]
+    for _ in range(2):
+        assert not is_instance((_callback,), type_, check_signature=True)
+        assert not is_instance(
+            (_callback,), type_, cache=True, check_signature=True)
+        assert is_instance((_callback,), type_, cache=True)
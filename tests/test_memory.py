@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Tests for the peak memory used by casting large payloads."""
+
+from __future__ import unicode_literals
+
+import gc
+
+import pytest
+
+from typingplus import *
+
+tracemalloc = pytest.importorskip('tracemalloc')
+
+_SIZE = 100000
+
+
+def _get_peak_ratio(type_, obj):
+    """Return the peak memory used to cast a value over the memory it keeps.
+
+    The items of the payloads are already of the right type, so only the
+    containers built by cast are counted.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = cast(type_, obj)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert result is not obj
+    return float(peak) / current
+
+
+@pytest.mark.parametrize('type_, obj, limit', [
+    (List[int], tuple(range(_SIZE)), 1.1),
+    (Tuple[int, ...], list(range(_SIZE)), 1.3),
+    (Deque[int], list(range(_SIZE)), 1.1),
+    # Sets resize their tables as they grow.
+    (Set[int], list(range(_SIZE)), 1.6),
+    (FrozenSet[int], list(range(_SIZE)), 1.6),
+    (Dict[int, Set[int]], {i: list(range(100)) for i in range(1000)}, 1.1),
+    (List[FrozenSet[int]], [list(range(1000)) for _ in range(100)], 1.1),
+    (Tuple[Deque[int], ...], [list(range(1000)) for _ in range(100)], 1.1),
+])
+def test_cast_peak_memory(type_, obj, limit):
+    """Test that casting does not keep intermediate copies of a payload."""
+    assert _get_peak_ratio(type_, obj) <= limit
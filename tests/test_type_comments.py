@@ -3,7 +3,10 @@
 
 from __future__ import unicode_literals
 
-from typingplus import get_type_hints
+from typingplus import (
+    get_type_hints,
+    List
+)
 
 
 def test_short_form_single():
@@ -190,3 +193,153 @@ def test_inherited_class_override():
     assert get_type_hints(TestClass11) == {
         'arg1': str
     }
+
+
+def test_inherited_class_cached(monkeypatch):
+    """Test that base class type hints are parsed once and reused."""
+    import inspect
+
+    class TestClass12(object):
+        arg1 = None  # type: int
+
+    class TestClass13(TestClass12):
+        arg2 = None  # type: str
+
+    class TestClass14(TestClass12):
+        arg3 = None  # type: bool
+
+    sources = []
+    getsource = inspect.getsource
+
+    def _getsource(obj):
+        sources.append(obj)
+        return getsource(obj)
+
+    monkeypatch.setattr(inspect, 'getsource', _getsource)
+    assert get_type_hints(TestClass13) == {'arg1': int, 'arg2': str}
+    assert get_type_hints(TestClass14) == {'arg1': int, 'arg3': bool}
+    assert get_type_hints(TestClass13) == {'arg1': int, 'arg2': str}
+    assert sources.count(TestClass12) == 1
+    assert sources.count(TestClass13) == 1
+
+
+def test_class_annotations_invalidate_cache():
+    """Test that annotations added to a class replace cached type hints."""
+    class TestClass15(object):
+        arg1 = None  # type: int
+
+    assert get_type_hints(TestClass15) == {'arg1': int}
+    TestClass15.__annotations__ = {'arg1': str}
+    assert get_type_hints(TestClass15) == {'arg1': str}
+
+
+def test_class_skips_method_bodies():
+    """Test that comments in method headers and bodies are not class hints."""
+    class TestClass16(object):
+        arg1 = None  # type: int
+
+        @staticmethod
+        def func(value,  # type: int
+                 other=None  # type: str
+                 ):
+            # type: (...) -> None
+            local = None  # type: bool
+            return local
+
+        arg2 = [
+            None,
+        ]  # type: List[str]
+
+        def one_liner(self): return None  # type: bool
+
+        arg3 = None  # type: bool
+
+    assert get_type_hints(TestClass16, globals()) == {
+        'arg1': int,
+        'arg2': List[str],
+        'arg3': bool
+    }
+
+
+def test_class_dedented_method_strings():
+    """Test that strings and brackets dedented in methods are skipped."""
+    class TestClass17(object):
+        arg1 = None  # type: int
+
+        def func(self):
+            value = """
+arg2 = None  # type: bool
+"""
+            other = (
+value)  # noqa: E122
+            return value, other
+
+        arg3 = None  # type: str
+
+    assert get_type_hints(TestClass17) == {'arg1': int, 'arg3': str}
+
+
+def test_class_blocks():
+    """Test that attributes in blocks in the class body have hints."""
+    def decorator(cls):
+        return cls
+
+    @decorator
+    class TestClass18(object):
+        arg1 = None  # type: int
+
+        if arg1 is None:
+            arg2 = None  # type: str
+        else:
+            def func(self):
+                arg3 = None  # type: bool
+                return arg3
+
+        try:
+            arg4 = None  # type: float
+        finally:
+            pass
+
+    assert get_type_hints(TestClass18) == {
+        'arg1': int,
+        'arg2': str,
+        'arg4': float
+    }
+
+
+def test_short_form_star_args():
+    """Test short-form type hinting with variable arguments."""
+    from typing import Dict, List
+
+    def func(arg1, *args, **kwargs):
+        # type: (List[Dict[str, int]], *str, **int) -> None
+        pass
+
+    assert get_type_hints(func, globals(), locals()) == {
+        'return': type(None),
+        'arg1': List[Dict[str, int]],
+        'args': str,
+        'kwargs': int
+    }
+
+
+def test_short_form_not_evaluated():
+    """Test that short-form type comments are parsed, not evaluated."""
+    import pytest
+
+    def func(arg1):
+        # type: (__import__('os').getcwd()) -> None
+        pass
+
+    with pytest.raises(SyntaxError):
+        get_type_hints(func)
+
+
+def test_short_form_namespace():
+    """Test that short-form hints are resolved against each namespace."""
+    def func(arg1):
+        # type: (Value) -> None
+        pass
+
+    assert get_type_hints(func, {'Value': int})['arg1'] is int
+    assert get_type_hints(func, {'Value': str})['arg1'] is str
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Tests for writing and loading parsed type hints."""
+
+from __future__ import unicode_literals
+
+import importlib
+import io
+import sys
+import textwrap
+
+import pytest
+
+from typingplus import (
+    dump_type_plans,
+    get_type_hints,
+    load_type_plans
+)
+
+_SOURCE = textwrap.dedent('''
+    class Base(object):
+        arg1 = None  # type: int
+
+
+    class Derived(Base):
+        arg2 = None  # type: str
+
+        def method(self, value):
+            # type: (int) -> str
+            return str(value)
+
+
+    def func(value):
+        # type: (int) -> bool
+        return bool(value)
+    ''')
+
+
+@pytest.fixture
+def module(tmpdir, monkeypatch):
+    """Create an importable module containing type hint comments."""
+    tmpdir.join('typed_module.py').write(_SOURCE)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    sys.modules.pop('typed_module', None)
+    yield importlib.import_module('typed_module')
+    sys.modules.pop('typed_module', None)
+
+
+def test_dump_and_load(module, monkeypatch):
+    """Test that loaded type hints are used instead of the source."""
+    import inspect
+
+    fp = io.BytesIO()
+    dump_type_plans([module.Derived, module.Derived.method, module.func], fp)
+    sys.modules.pop('typed_module')
+    module = importlib.import_module('typed_module')
+    fp.seek(0)
+    assert load_type_plans(fp, strict=True) == []
+
+    getsource = inspect.getsource
+
+    def _getsource(obj):
+        assert getattr(obj, '__module__', None) != 'typed_module'
+        return getsource(obj)
+
+    monkeypatch.setattr(inspect, 'getsource', _getsource)
+    assert get_type_hints(module.Derived) == {'arg1': int, 'arg2': str}
+    assert get_type_hints(module.Derived.method) == {
+        'return': str,
+        'value': int
+    }
+    assert get_type_hints(module.func) == {'return': bool, 'value': int}
+
+
+def test_load_stale(module, tmpdir):
+    """Test that type hints are not loaded when the source has changed."""
+    fp = io.BytesIO()
+    dump_type_plans([module.func], fp)
+    tmpdir.join('typed_module.py').write(_SOURCE + '\n\nCONSTANT = 1\n')
+    fp.seek(0)
+    assert load_type_plans(fp) == ['typed_module:func']
+    fp.seek(0)
+    with pytest.raises(ValueError):
+        load_type_plans(fp, strict=True)
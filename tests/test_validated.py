@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests for containers that are validated as they change."""
+
+from __future__ import unicode_literals
+
+import pytest
+
+from typingplus import *
+
+
+def test_validated_list():
+    """Test that items added to a validated list are validated."""
+    actual = validated(List[int], [1, 2])
+    actual.append(3)
+    actual.insert(0, 0)
+    actual.extend([4])
+    actual += [5]
+    actual[0:1] = [6]
+    assert actual == [6, 1, 2, 3, 4, 5]
+    assert is_instance(actual, List[int])
+    for change in (lambda: actual.append('a'),
+                   lambda: actual.insert(0, 'a'),
+                   lambda: actual.extend(['a']),
+                   lambda: actual.__setitem__(0, 'a'),
+                   lambda: actual.__setitem__(slice(0, 1), ['a'])):
+        with pytest.raises(TypeError):
+            change()
+    assert actual == [6, 1, 2, 3, 4, 5]
+
+
+def test_validated_dict():
+    """Test that keys and values set in a validated dict are validated."""
+    actual = validated(Dict[str, int], {'a': 1})
+    actual['b'] = 2
+    actual.update({'c': 3}, d=4)
+    actual.setdefault('e', 5)
+    assert actual == {'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5}
+    assert is_instance(actual, Dict[str, int])
+    for change in (lambda: actual.__setitem__(1, 1),
+                   lambda: actual.__setitem__('a', 'a'),
+                   lambda: actual.update(f='f'),
+                   lambda: actual.setdefault('f', 'f')):
+        with pytest.raises(TypeError):
+            change()
+    assert actual == {'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5}
+
+
+def test_validated_set():
+    """Test that items added to a validated set are validated."""
+    actual = validated(Set[int], {1})
+    actual.add(2)
+    actual.update([3], [4])
+    actual |= {5}
+    assert actual == {1, 2, 3, 4, 5}
+    assert is_instance(actual, Set[int])
+    for change in (lambda: actual.add('a'),
+                   lambda: actual.update(['a']),
+                   lambda: actual.symmetric_difference_update(['a'])):
+        with pytest.raises(TypeError):
+            change()
+    assert actual == {1, 2, 3, 4, 5}
+
+
+def test_validated_invalid():
+    """Test that invalid items and types are rejected."""
+    with pytest.raises(TypeError):
+        validated(List[int], [1, 'a'])
+    with pytest.raises(TypeError):
+        validated(Tuple[int, ...], [1])
+
+
+def test_validated_not_rechecked(monkeypatch):
+    """Test that is_instance does not check the items of a validated list."""
+    actual = validated(List[int], range(3))
+    monkeypatch.setattr(type(actual), '__iter__', None)
+    assert is_instance(actual, List[int])
@@ -6,29 +6,57 @@ and typing_extensions modules export.
 
 Functions:
     cast: Casts a value to a specific type.
+    dump_type_plans: Writes the type hints parsed from the source of functions
+        and classes to a file.
     eval_type: Evaluates a type, or a string of the type.
+    get_cast_stats: Gets counts of how cast used the candidates it learned for
+        each pair of value type and target type.
     get_type_hints: Gets all type hints for an object, including comment type
         hints.
     is_instance: An implementation of isinstance that works with the type
         definitions from the typing library.
+    load_type_plans: Loads type hints written by dump_type_plans so they are
+        not parsed from source again.
     upgrade_typing: Globally replaces the stdlib version of typing with the
         latest version.
+    validated: Wraps a list, dict or set so that it is validated against a type
+        as it changes.
+    validation_budget: Limits the depth, number of items and time used by
+        is_instance and cast.
+
+Exceptions:
+    BudgetExceededError: Raised when a validation_budget is exceeded.
 """
 # pragma pylint: disable=undefined-variable
 
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import abc
+import array
 import collections
+import contextlib
 import functools
+import importlib
 import inspect
+import os
 import re
 import sys
+import textwrap
+import threading
+import time
 import tokenize
 import types
+import weakref
+
+try:
+    import collections.abc as collections_abc
+except ImportError:
+    collections_abc = collections
 
 import pkg_resources
 import six
+from six.moves import cPickle as pickle
 
 if 0:  # pylint: disable=using-constant-test
     # Assure names exist so typingplus connsumers don't get linting errors.
@@ -137,7 +165,9 @@ if (3, 5) <= sys.version_info < _TYPING_BACKPORT_VERSION:
     )
     globals()['__all__'] = tuple(set(str(v) for v in globals()['__all__']))
 
-globals()['__all__'] += ('is_instance', 'eval_type')
+globals()['__all__'] += ('is_instance', 'eval_type', 'dump_type_plans',
+                         'load_type_plans', 'validated', 'validation_budget',
+                         'BudgetExceededError', 'get_cast_stats')
 
 _get_type_hints = typing.get_type_hints
 
@@ -148,6 +178,154 @@ MutableSequence.register(collections.deque)
 
 ForwardRef = globals().get('ForwardRef', globals().get('_ForwardRef'))
 
+# Generic aliases of the standard library typing module (3.7+) expose their
+# structure through get_origin and get_args instead of the classes used by the
+# typing backport.
+_MODERN_TYPING = sys.version_info >= (3, 7)
+
+if hasattr(typing, 'get_origin'):
+    _get_origin = typing.get_origin
+    _get_args = typing.get_args
+else:
+    def _get_origin(type_):
+        # type: (Any) -> Any
+        """Return the unsubscripted version of a generic type, or None."""
+        return getattr(type_, '__origin__', None)
+
+    def _get_args(type_):
+        # type: (Any) -> Tuple[Any, ...]
+        """Return the arguments of a generic type."""
+        return getattr(type_, '__args__', None) or ()
+
+# The origins of Union[X, Y] and X | Y (3.10+).
+_UNION_TYPES = (Union,) + tuple(
+    t for t in (getattr(types, 'UnionType', None),) if t)
+
+# The origin of Concatenate[X, P] (3.10+).
+_CONCATENATE = globals().get('Concatenate')
+
+# Special forms whose first argument is the type that is checked.
+_WRAPPER_TYPES = tuple(
+    t for t in (getattr(typing, n, None) for n in (
+        'ClassVar', 'Final', 'Annotated', 'Required', 'NotRequired')) if t)
+
+_TYPE_COMMENT = re.compile(r'#\s*type:(.+)')
+
+# The tokens that open or close strings and brackets, start comments or
+# continue lines in the lines skipped by the class body scanner.
+_SKIPPED_LINE_TOKEN = re.compile(
+    r'''"""|\'\'\'|"|'|#|[(\[{)\]}]|\\\r?\n''')
+
+# The escapes and closing quotes of each kind of string.
+_STRING_ENDS = {
+    quote: re.compile(r'\\.|' + quote, re.DOTALL)
+    for quote in ('"""', "'''", '"', "'")
+}
+
+_SHORT_FORM_TOKEN = re.compile(r'''\s*(?:
+    (?P<string>'[^']*'|"[^"]*")|
+    (?P<number>-?\d+)|
+    (?P<name>[^\W\d]\w*(?:\s*\.\s*[^\W\d]\w*)*)|
+    (?P<op>\.\.\.|\*\*|[*\[\](),])
+)\s*''', re.UNICODE | re.VERBOSE)
+
+# Parsed short-form type comments and the names used by each of them.
+_SHORT_FORM_PLANS = {}  # type: Dict[str, Tuple[Tuple, Tuple[str, ...]]]
+
+# Short-form type comments built from the objects bound to their names.
+_SHORT_FORM_CACHE = {}  # type: Dict[Tuple[str, Tuple[int, ...]], Tuple]
+_SHORT_FORM_CACHE_SIZE = 1024
+
+# Well-known concrete types used to cast to the abstract types they implement.
+_ABC_CAST_TYPES = tuple(set(six.string_types + (
+    six.text_type, bytes, bytearray, tuple, list, set, frozenset, dict,
+    memoryview, collections.deque, collections.OrderedDict,
+    collections.Counter)))
+
+# The concrete cast types of each abstract type and the abc cache token at the
+# time they were computed.
+_ABC_CAST_TYPES_CACHE = weakref.WeakKeyDictionary()
+
+_get_abc_cache_token = getattr(
+    abc, 'get_cache_token', lambda: abc.ABCMeta._abc_invalidation_counter)
+
+# The array typecodes used for compact casts of each item type. The "q"
+# typecode and memoryview.cast were added in Python 3.3, so only floats are
+# compact in earlier versions. Typecodes must be native strings in Python 2.
+_COMPACT_TYPECODES = {float: str('d')}
+if hasattr(memoryview, 'cast'):
+    _COMPACT_TYPECODES.update({int: str('q'), bool: str('?')})
+
+# The item types of the array typecodes and memoryview formats.
+_COMPACT_ITEM_TYPES = dict(
+    [(typecode, int) for typecode in 'bBhHiIlLqQ'] +
+    [(typecode, float) for typecode in 'fd'] +
+    [('?', bool)]
+)
+
+# Built-in types whose instances cannot be changed.
+_IMMUTABLE_TYPES = frozenset(six.integer_types + six.string_types + (
+    type(None), type(Ellipsis), bool, float, complex, six.text_type, bytes))
+
+# The results of is_instance for deeply immutable objects keyed on the id of
+# the object, the type and whether signatures are checked, in the order they
+# were added. Each entry keeps its object alive, so only objects of up to
+# _INSTANCE_CACHE_OBJECT_SIZE bytes in total are cached.
+_INSTANCE_CACHE = collections.OrderedDict()
+_INSTANCE_CACHE_SIZE = 4096
+_INSTANCE_CACHE_OBJECT_SIZE = 16 * 1024
+
+# The active validation_budget of each thread.
+_BUDGETS = threading.local()
+
+# The error raised when the maximum recursion depth is exceeded (3.5+). Earlier
+# versions raise a RuntimeError. See _is_fatal_error.
+_RecursionError = getattr(six.moves.builtins, 'RecursionError', None)
+
+_monotonic = getattr(time, 'monotonic', time.time)
+
+# The containers that are built directly from the items as they are cast, as
+# they accept any iterable of items in their constructors.
+_SINGLE_PASS_TYPES = frozenset((
+    list, tuple, set, frozenset, dict, collections.deque,
+    collections.OrderedDict))
+
+# The cast candidate learned for each pair of value type and target type, the
+# number of times in a row it has failed since and the abc cache token when it
+# was learned, or False if values are not cast to the target type based on
+# their type alone, in the order they were added. A candidate of None means the
+# value is returned as is.
+_CAST_SPECIALIZATIONS = collections.OrderedDict()
+_CAST_SPECIALIZATIONS_SIZE = 4096
+
+# The number of times in a row a learned candidate may fail before it is
+# dropped and learned again.
+_CAST_DEOPT_THRESHOLD = 8
+
+# Returned by _cast_specialized when the value must be cast without a learned
+# candidate.
+_NOT_SPECIALIZED = object()
+
+# Counts of how cast used the candidates it learned. See get_cast_stats.
+_CAST_STATS = collections.Counter()
+
+# The classes that may be used where another class is expected (PEP 484).
+_NUMERIC_PROMOTIONS = {int: (float, complex), float: (complex,)}
+
+# The results of signature checks keyed on the code object of each function and
+# the Callable type and whether the function is bound. Each result is stored
+# with the annotations and defaults of the function it was computed for, as
+# functions that share a code object may have different ones.
+_SIGNATURE_CACHE = weakref.WeakKeyDictionary()
+
+# Type hints parsed from the source of each class, excluding its bases.
+_CLASS_HINTS_CACHE = weakref.WeakKeyDictionary()
+
+# Type hint comments parsed from the source of each function code object.
+_FUNC_COMMENTS_CACHE = weakref.WeakKeyDictionary()
+
+_TYPE_PLANS_VERSION = 1
+
 
 def upgrade_typing():
     # type: () -> None
@@ -236,7 +414,9 @@ def _get_type_comments(source):
         type is the type hint. If a short-form type hint is reached, it is
         yielded as a single string containing the entire type hint.
     """
-    reader = six.StringIO(inspect.cleandoc(source)).readline
+    reader = six.StringIO(  # Sources without type comments are not read.
+        inspect.cleandoc(source) if _TYPE_COMMENT.search(source) else ''
+    ).readline
     name = last_token = None
     tokens = tokenize.generate_tokens(reader)
     is_func = source.startswith('def')
@@ -252,7 +432,7 @@ def _get_type_comments(source):
             elif last_token != tokenize.OP:
                 name = value
         elif token == tokenize.COMMENT and indent_level == 1:
-            match = re.match(r'#\s*type:(.+)', value)
+            match = _TYPE_COMMENT.match(value)
             if match:
                 type_sig = match.group(1).strip()
                 if '->' in type_sig and last_token == tokenize.NEWLINE:
@@ -264,6 +444,197 @@ def _get_type_comments(source):
         last_token = token
 
 
+def _get_class_type_comments(source):
+    # type: (str) -> List[Tuple[str, str]]
+    """Return the type hint comments of the attributes in a class body.
+
+    Only the statements directly in the class body are tokenized. The bodies
+    of nested functions and classes are skipped line by line, so the work done
+    scales with the number of class attributes rather than the size of the
+    class. If the source cannot be scanned this way, it is fully tokenized.
+
+    Args:
+        source: The source code of the class to search for type hint comments.
+
+    Returns:
+        A list of (name, type) pairs, where the name is the name of the class
+        attribute and type is the type hint.
+    """
+    if not _TYPE_COMMENT.search(source):
+        return []
+    lines = textwrap.dedent(source).splitlines(True)
+    try:
+        return list(_scan_class_body(lines))
+    except (tokenize.TokenError, SyntaxError):
+        return list(_get_type_comments(source))
+
+
+def _scan_class_body(lines):
+    # type: (List[str]) -> Generator[Tuple[str, str], None, None]
+    """Yield the type hint comments of the statements in a class body.
+
+    Args:
+        lines: The lines of the dedented source code of the class.
+
+    Yields:
+        All type comments of the class attributes as (name, type) pairs,
+        including those in blocks such as "if" or "try" in the class body.
+
+    Raises:
+        TokenError: The class body ended before the end of the source.
+    """
+    reader = _ClassBodyReader(lines)
+    name = last_token = header_indent = None
+    statement_start = True
+    for token, value, start in reader.tokens():
+        if token == tokenize.NEWLINE:
+            if header_indent is not None:
+                reader.skip_indent = header_indent
+                header_indent = None
+            name = None
+        elif token == tokenize.NAME and header_indent is None:
+            if statement_start and value in ('def', 'class', 'async'):
+                header_indent = start[1]
+            elif last_token != tokenize.OP:
+                name = value
+        elif token == tokenize.COMMENT and name and header_indent is None:
+            match = _TYPE_COMMENT.match(value)
+            if match:
+                yield name, match.group(1).strip()
+                name = None
+        if token not in (tokenize.NL, tokenize.COMMENT):
+            statement_start = token in (
+                tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT)
+            last_token = token
+
+
+class _ClassBodyReader(object):
+    """Reads the lines of a class, skipping the bodies of nested definitions.
+
+    Once skip_indent is set, lines indented further than it are skipped until
+    a line that is not. Strings, brackets and backslash continuations that
+    span lines are tracked, so their lines are skipped however they are
+    indented.
+    """
+
+    def __init__(self, lines):
+        # type: (List[str]) -> None
+        """Initialize the reader.
+
+        Args:
+            lines: The lines of the dedented source code of the class.
+        """
+        self.lines = lines
+        self.index = 0
+        self.skip_indent = None  # type: Optional[int]
+        self._quote = None  # type: Optional[str]
+        self._brackets = 0
+        self._continued = False
+
+    def readline(self):
+        # type: () -> str
+        """Return the next line that is not part of a nested body."""
+        while self.index < len(self.lines):
+            line = self.lines[self.index]
+            self.index += 1
+            if self.skip_indent is not None:
+                if self._is_nested(line):
+                    self._scan(line)
+                    continue
+                self.skip_indent = None
+            return line
+        return ''
+
+    def tokens(self):
+        # type: () -> Generator[Tuple[int, str, Tuple[int, int]], None, None]
+        """Yield the tokens of the class body, after the class header.
+
+        Yields:
+            The type, value and start of each token.
+
+        Raises:
+            TokenError: The class body ended before the end of the source.
+        """
+        depth = 0
+        in_header = in_body = False
+        for token, value, start, _, _ in tokenize.generate_tokens(
+                self.readline):
+            if not in_body:  # Skip the decorators and the class header.
+                in_header = in_header or value == 'class'
+                in_body = in_header and token == tokenize.NEWLINE
+                continue
+            if token == tokenize.INDENT:
+                depth += 1
+            elif token == tokenize.DEDENT:
+                depth -= 1
+                if depth < 1:
+                    self._check_exhausted()
+                    return
+            yield token, value, start
+
+    def _check_exhausted(self):
+        # type: () -> None
+        """Raise an error if any code is left after the end of the class.
+
+        Raises:
+            TokenError: A line that is not blank or a comment is left.
+        """
+        for line in self.lines[self.index:]:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('#'):
+                raise tokenize.TokenError(
+                    'The class body ended before the end of its source.')
+
+    def _is_nested(self, line):
+        # type: (str) -> bool
+        """Determine if a line is part of the nested body being skipped."""
+        if self._quote or self._brackets or self._continued:
+            return True
+        stripped = line.lstrip()
+        return (not stripped or stripped.startswith('#') or
+                len(line) - len(stripped) > self.skip_indent)
+
+    def _scan(self, line):
+        # type: (str) -> None
+        """Track the strings and brackets left open by a skipped line."""
+        self._continued = False
+        pos = self._skip_string(line, 0) if self._quote else 0
+        while pos >= 0:
+            match = _SKIPPED_LINE_TOKEN.search(line, pos)
+            if not match or match.group() == '#':
+                return
+            value = match.group()
+            if value in '([{':
+                self._brackets += 1
+            elif value in ')]}':
+                self._brackets = max(self._brackets - 1, 0)
+            elif value.startswith('\\'):
+                self._continued = True
+                return
+            else:
+                self._quote = value
+                pos = self._skip_string(line, match.end())
+                continue
+            pos = match.end()
+
+    def _skip_string(self, line, pos):
+        # type: (str, int) -> int
+        """Return the position after the open string, or -1 if it continues.
+
+        Args:
+            line: The line containing the rest of the string.
+            pos: The position in the line after the quote that opened the
+                string, or the start of the line.
+        """
+        for match in _STRING_ENDS[self._quote].finditer(line, pos):
+            if match.group() == self._quote:
+                self._quote = None
+                return match.end()
+        if len(self._quote) == 1 and not line.endswith('\\\n'):
+            self._quote = None  # An unterminated string ends at the line.
+        return -1
+
+
 def _get_comment_type_hints(obj,  # type: Any
                             globalns,  # type: Dict[str, Any]
                             localns  # type: Dict[str, Any]
@@ -301,6 +672,9 @@ def _get_class_type_hints(type_,  # type: Type
     # type: (...) -> Dict[str, Any]
     """Get a mapping of class attr names to type hints from type hint comments.
 
+    The hints of each class in the MRO are resolved once and cached, so the
+    hints of a derived class are composed from the cached hints of its bases.
+
     Args:
         type_: The class object to search for type hint comments.
 
@@ -310,22 +684,41 @@ def _get_class_type_hints(type_,  # type: Type
     """
     hints = {}
     for base in reversed(type_.__mro__):
-        if globalns is None:
-            try:
-                base_globals = sys.modules[base.__module__].__dict__
-            except KeyError:
-                base_globals = globalns
-        else:
-            base_globals = globalns
-        base_hints = vars(base).get('__annotations__', {})
-        if not base_hints:
-            try:
-                source = inspect.getsource(base)
-                ns = localns if base is type_ else {}
-                base_hints = _get_comment_type_hints(source, base_globals, ns)
-            except (IOError, TypeError):
-                pass
-        hints.update(base_hints)
+        hints.update(_get_own_class_type_hints(base))
+    return hints
+
+
+def _get_own_class_type_hints(type_):
+    # type: (Type) -> Dict[str, Any]
+    """Get the type hints defined directly on a class, excluding its bases.
+
+    Annotations are used when the class defines them; otherwise, the type hint
+    comments in the class source are used. Hints parsed from the source are
+    cached, but annotations always take precedence, so the cached hints are
+    ignored as soon as annotations are added to the class.
+
+    Args:
+        type_: The class object to search for type hints.
+
+    Returns:
+        A dictionary mapping the class attribute names to the type hints
+        defined on the class itself. The dictionary must not be modified.
+    """
+    annotations = vars(type_).get('__annotations__')
+    if annotations:
+        return annotations
+    try:
+        return _CLASS_HINTS_CACHE[type_]
+    except (KeyError, TypeError):
+        pass
+    try:
+        hints = dict(_get_class_type_comments(inspect.getsource(type_)))
+    except (IOError, TypeError):
+        hints = {}
+    try:
+        _CLASS_HINTS_CACHE[type_] = hints
+    except TypeError:
+        pass
     return hints
 
 
@@ -343,17 +736,15 @@ def _get_func_type_hints(func,  # type: Callable[..., Any]
         A dictionary mapping the function parameters to the type hints found
         for each parameter in the type hint comments.
     """
-    try:
-        source = inspect.getsource(func)
-    except (IOError, TypeError):
+    comments = _get_func_type_comments(func)
+    if comments is None:
         return {}
     hints = {}
     getargspec = getattr(
         inspect, 'get{}argspec'.format('full' if six.PY3 else ''))
     full_signature = getargspec(func)
     signature = list(full_signature[0]) + [s for s in full_signature[1:3] if s]
-    for comment in _get_type_comments(source):
-        name, value = comment
+    for name, value in comments:
         if name in signature:
             hints[name] = value
         elif name.startswith('(') and name.endswith(')'):
@@ -370,6 +761,35 @@ def _get_func_type_hints(func,  # type: Callable[..., Any]
     return hints
 
 
+def _get_func_type_comments(func):
+    # type: (Callable[..., Any]) -> Optional[List[Tuple[str, str]]]
+    """Return the type hint comments of a function.
+
+    The comments are cached per code object of the function.
+
+    Args:
+        func: The function to search for type hint comments.
+
+    Returns:
+        A list of the (name, type) pairs yielded by _get_type_comments for the
+        source of the function, or None if the source is not available.
+    """
+    code = getattr(func, '__code__', None)
+    try:
+        return _FUNC_COMMENTS_CACHE[code]
+    except (KeyError, TypeError):
+        pass
+    try:
+        comments = list(_get_type_comments(inspect.getsource(func)))
+    except (IOError, TypeError):
+        comments = None
+    try:
+        _FUNC_COMMENTS_CACHE[code] = comments
+    except TypeError:
+        pass
+    return comments
+
+
 def _get_func_defaults(func):
     # type: (Callable[..., Any]) -> Dict[str, Any]
     """Get the default values for the function parameters.
@@ -380,13 +800,15 @@ def _get_func_defaults(func):
     Returns:
         A mapping of parameter names to default values.
     """
-    _func_like = functools.wraps(func)(lambda: None)
-    _func_like.__defaults__ = getattr(func, '__defaults__', None)
-    if hasattr(func, '__code__'):
-        _func_like.__code__ = func.__code__
-    if not hasattr(_func_like, '__kwdefaults__'):
-        _func_like.__kwdefaults__ = {}
-    return _get_defaults(_func_like)
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return {}
+    pos_count = code.co_argcount
+    arg_names = code.co_varnames[:pos_count]
+    defaults = getattr(func, '__defaults__', None) or ()
+    defaults_ = dict(getattr(func, '__kwdefaults__', None) or {})
+    defaults_.update(zip(arg_names[pos_count - len(defaults):], defaults))
+    return defaults_
 
 
 def _parse_short_form(comment, globalns, localns):
@@ -394,7 +816,12 @@ def _parse_short_form(comment, globalns, localns):
     """Return the hints from the comment.
 
     Parses the left-hand side of a type comment into a list of type objects.
-    (e.g. everything to the left of "->").
+    (e.g. everything to the left of "->"). The comment is never evaluated as
+    Python code; only names, attribute access, subscripts and literals are
+    understood.
+
+    The result is cached per comment and the objects bound to the names it
+    uses, so a comment is only parsed and built once per namespace.
 
     Returns:
         A list of types evaluated from the type comment in the given global
@@ -402,50 +829,665 @@ def _parse_short_form(comment, globalns, localns):
     """
     if '(...)' in comment:
         return ()
-    comment = comment.replace('*', '')
-    hints = eval(comment, globalns, localns)  # pylint: disable=eval-used
-    if not isinstance(hints, tuple):
-        hints = (hints,)
+    plan, names = _compile_short_form(comment)
+    values = tuple(_resolve_name(name, globalns, localns) for name in names)
+    key = (comment, tuple(id(v) for v in values))
+    try:
+        cached_values, hints = _SHORT_FORM_CACHE[key]
+        if all(a is b for a, b in zip(cached_values, values)):
+            return hints
+    except KeyError:
+        pass
+    namespace = dict(zip(names, values))
+    hints = tuple(_build_short_form(node, namespace) for node in plan)
+    if len(_SHORT_FORM_CACHE) >= _SHORT_FORM_CACHE_SIZE:
+        _SHORT_FORM_CACHE.clear()
+    _SHORT_FORM_CACHE[key] = (values, hints)
     return hints
 
 
-def cast(tp, obj):
-    # type: (Type[_T], Any) -> _T
+def _compile_short_form(comment):
+    # type: (str) -> Tuple[Tuple[Any, ...], Tuple[str, ...]]
+    """Parse the left-hand side of a short-form type comment.
+
+    Args:
+        comment: The parenthesized argument types of a type comment.
+
+    Returns:
+        A tuple containing the parsed expression of each argument type and the
+        names that must be resolved to build them.
+
+    Raises:
+        SyntaxError: The comment is not a valid short-form type comment.
+    """
+    try:
+        return _SHORT_FORM_PLANS[comment]
+    except KeyError:
+        pass
+    parser = _ShortFormParser(comment)
+    parser.next_token('(')
+    plan = parser.parse_list(')')
+    parser.next_token(None)
+    _SHORT_FORM_PLANS[comment] = plan, tuple(parser.names)
+    return _SHORT_FORM_PLANS[comment]
+
+
+class _ShortFormParser(object):
+    """A recursive descent parser for the types in short-form type comments.
+
+    Expressions are parsed into nested tuples where the first item is the kind
+    of the expression: a name, a constant, a list or tuple of expressions, or
+    a subscript of an expression.
+    """
+
+    def __init__(self, comment):
+        # type: (str) -> None
+        """Split the comment into tokens.
+
+        Args:
+            comment: The type comment to parse.
+        """
+        self.comment = comment
+        self.names = []  # type: List[str]
+        self.tokens = []  # type: List[Tuple[Optional[str], Optional[str]]]
+        self.index = 0
+        position = 0
+        while position < len(comment):
+            match = _SHORT_FORM_TOKEN.match(comment, position)
+            if not match:
+                self.error()
+            self.tokens.append((match.lastgroup,
+                                match.group(match.lastgroup)))
+            position = match.end()
+        self.tokens.append((None, None))
+
+    def error(self):
+        # type: () -> None
+        """Raise an error for the comment being parsed."""
+        raise SyntaxError('Invalid type comment: {}'.format(self.comment))
+
+    def peek(self):
+        # type: () -> Optional[str]
+        """Return the value of the next token without consuming it."""
+        return self.tokens[self.index][1]
+
+    def next_token(self, expected=''):
+        # type: (Optional[str]) -> Tuple[Optional[str], Optional[str]]
+        """Consume and return the next token.
+
+        Args:
+            expected: The value the token must have, if any.
+
+        Returns:
+            A tuple containing the kind and value of the token.
+        """
+        token = self.tokens[self.index]
+        if expected != '' and token[1] != expected:
+            self.error()
+        self.index += 1
+        return token
+
+    def parse_list(self, close):
+        # type: (str) -> Tuple[Tuple[Any, ...], ...]
+        """Parse comma separated expressions up to the closing bracket.
+
+        Args:
+            close: The closing bracket.
+
+        Returns:
+            A tuple of the parsed expressions.
+        """
+        nodes = []
+        while self.peek() != close:
+            if close == ')' and self.peek() in ('*', '**'):
+                self.next_token()
+            nodes.append(self.parse_expr())
+            if self.peek() != ',':
+                break
+            self.next_token()
+        self.next_token(close)
+        return tuple(nodes)
+
+    def parse_expr(self):
+        # type: () -> Tuple[Any, ...]
+        """Parse a single type expression, including any subscripts."""
+        kind, value = self.next_token()
+        if kind == 'name':
+            value = re.sub(r'\s+', '', value)
+            if value not in self.names:
+                self.names.append(value)
+            node = ('name', value)  # type: Tuple[Any, ...]
+        elif kind == 'string':
+            node = ('const', value[1:-1])
+        elif kind == 'number':
+            node = ('const', int(value))
+        elif value == '...':
+            node = ('const', Ellipsis)
+        elif value in ('[', '('):
+            close = ']' if value == '[' else ')'
+            node = ('list' if value == '[' else 'tuple',
+                    self.parse_list(close))
+        else:
+            self.error()
+        while self.peek() == '[':
+            self.next_token()
+            node = ('subscript', node, self.parse_list(']'))
+        return node
+
+
+def _resolve_name(name, globalns, localns):
+    # type: (str, Dict[str, Any], Dict[str, Any]) -> Any
+    """Resolve a possibly dotted name the same way eval would.
+
+    Args:
+        name: The name to resolve.
+        globalns: The global namespace.
+        localns: The local namespace.
+
+    Returns:
+        The object bound to the name.
+
+    Raises:
+        NameError: The name is not defined in any namespace.
+    """
+    parts = name.split('.')
+    for namespace in (localns or {}, globalns or {}, vars(six.moves.builtins)):
+        if parts[0] in namespace:
+            value = namespace[parts[0]]
+            break
+    else:
+        raise NameError("name '{}' is not defined".format(parts[0]))
+    for part in parts[1:]:
+        value = getattr(value, part)
+    return value
+
+
+def _build_short_form(node, namespace):
+    # type: (Tuple[Any, ...], Dict[str, Any]) -> Any
+    """Build the value of a parsed type expression.
+
+    Args:
+        node: An expression parsed by _compile_short_form.
+        namespace: A mapping of the names in the expression to their values.
+
+    Returns:
+        The value of the expression.
+    """
+    kind = node[0]
+    if kind == 'name':
+        return namespace[node[1]]
+    if kind == 'const':
+        return node[1]
+    if kind == 'list':
+        return [_build_short_form(n, namespace) for n in node[1]]
+    if kind == 'tuple':
+        return tuple(_build_short_form(n, namespace) for n in node[1])
+    value = _build_short_form(node[1], namespace)
+    args = tuple(_build_short_form(n, namespace) for n in node[2])
+    return value[args[0] if len(args) == 1 else args]
+
+
+def cast(tp, obj, compact=False):
+    # type: (Type[_T], Any, bool) -> _T
     """Cast the value to the given type.
 
     Args:
         tp: The type the value is expected to be cast.
         obj: The value to cast.
+        compact: If True, sequences of ints, floats or bools cast to a type
+            that is satisfied by a packed buffer (e.g. Sequence[int]) are
+            stored in an array.array or memoryview instead of a list.
 
     Returns:
         The cast value if it was possible to determine the type and cast it.
+        Casting to Iterator[T] or Generator[T, ...], or casting an iterator to
+        Iterable[T], returns an iterator that casts each item as it is pulled.
+        If an item cannot be cast, the TypeError is raised by that iterator.
+
+    Raises:
+        TypeError: The value cannot be cast to the type.
+        BudgetExceededError: The active validation_budget was exceeded.
     """
-    if is_instance(obj, tp):
+    budget = getattr(_BUDGETS, 'current', None)
+    if budget is None:
+        return _cast(tp, obj, compact)
+    budget.enter()
+    try:
+        return _cast(tp, obj, compact)
+    finally:
+        budget.exit()
+
+
+def _cast(tp, obj, compact):
+    # type: (Type[_T], Any, bool) -> _T
+    """Cast the value to the given type. See cast."""
+    key = None if compact else _get_specialization_key(tp, obj)
+    result = _cast_specialized(key, obj)
+    if result is not _NOT_SPECIALIZED:
+        return result
+    if compact:
+        compact_obj = _cast_compact(tp, obj)
+        if compact_obj is not None:
+            return compact_obj
+    lazy_obj = _cast_lazy(tp, obj, compact)
+    if lazy_obj is not None:
+        return lazy_obj
+    # The value was counted against the validation_budget by cast, so it is
+    # checked and cast to candidate types without counting it again.
+    if _is_instance(obj, tp, False, False):
+        _specialize(key, tp, None)
         return obj
-    type_repr = repr(tp)
-    obj_repr = repr(obj)
+    original_obj = obj
     if tp in _STRING_TYPES:
         obj = _cast_string(tp, obj)
-        if is_instance(obj, tp):
+        if _is_instance(obj, tp, False, False):
             return obj
-    if (hasattr(tp, '__origin__') and
-            tp.__origin__ or hasattr(tp, '__args__') and tp.__args__):
-        obj = _cast_iterables(tp, obj)
-    for type_ in _get_cast_types(tp):
+    if _get_origin(tp) or _get_args(tp):
+        cast_obj = _cast_iterables(tp, obj, compact)
+        if (cast_obj is not obj and
+                type(cast_obj) is _get_container_type(tp)):
+            return cast_obj
+        obj = cast_obj
+    return _cast_candidates(tp, obj, original_obj, compact, key)
+
+
+def _cast_candidates(tp, obj, original_obj, compact, key):
+    # type: (Type[_T], Any, Any, bool, Optional[tuple]) -> _T
+    """Cast a value with the first candidate type of a type that accepts it.
+
+    Args:
+        tp: The type the value is cast to.
+        obj: The value to cast, after its items were cast.
+        original_obj: The value that was passed to cast.
+        compact: Whether items are cast with compact set. See cast.
+        key: The key returned by _get_specialization_key, or None.
+
+    Returns:
+        The value cast by the first candidate type that accepts it. If none
+        accepts it, but its items were cast into a container that is an
+        instance of the type, e.g. a list for Iterable[int], the container.
+
+    Raises:
+        TypeError: No candidate type accepts the value.
+    """
+    error = None
+    cast_types = _get_cast_types(tp)
+    for index, type_ in enumerate(cast_types):
         try:
-            args = getattr(type_, '__args__', None)
+            args = _get_args(type_)
             constraints = getattr(type_, '__constraints__', None)
             if args or constraints:
-                return cast(type_, obj)
-            return type_(obj)
-        except Exception as e:  # pylint: disable=broad-except,unused-variable
-            pass
+                return _cast(type_, obj, compact)
+            result = type_(obj)
+        except Exception as e:  # pylint: disable=broad-except
+            if _is_fatal_error(e):
+                raise
+            error = e
+        else:
+            _specialize(key, tp, type_, cast_types[:index])
+            return result
+    origin = _get_origin(tp)
+    if (obj is not original_obj and isinstance(origin, type) and
+            isinstance(obj, origin)):
+        return obj  # The items were cast into a container that satisfies tp.
     six.raise_from(
-        TypeError("Cannot convert {} to {}.".format(obj_repr, type_repr)),
-        locals().get('e')
+        TypeError("Cannot convert {!r} to {!r}.".format(original_obj, tp)),
+        error
+    )
+
+
+def _is_fatal_error(error):
+    # type: (Exception) -> bool
+    """Determine if an error raised by a cast candidate must be raised again.
+
+    Args:
+        error: The error raised by a cast candidate.
+
+    Returns:
+        True if the error means the validation_budget was exceeded or the
+        maximum recursion depth was exceeded, instead of that the candidate
+        does not accept the value; otherwise, False.
+    """
+    if isinstance(error, BudgetExceededError):
+        return True
+    if _RecursionError is not None:
+        return isinstance(error, _RecursionError)
+    return (type(error) is RuntimeError and
+            'maximum recursion depth' in str(error))
+
+
+def get_cast_stats():
+    # type: () -> Dict[str, int]
+    """Get counts of how cast used the candidates it learned.
+
+    For each pair of value type and target type, cast learns which candidate
+    cast the value and tries it first the next time. A pair is only learned
+    when the target type is a class or a Union of classes, so that whether the
+    value is already an instance depends only on the type of the value, and
+    when every candidate tried before it is abstract and cannot succeed for
+    any value. If the learned candidate fails, cast falls back to trying all
+    of the candidates in order, so the result is always the same. A learned
+    candidate is also dropped if a class was registered with an abstract base
+    class since it was learned, as that may change which values are instances
+    of the target type.
+
+    Returns:
+        A dict with the number of casts that used a learned candidate
+        ("hits"), the number where the learned candidate failed ("misses"),
+        the number of candidates learned ("specializations"), the number
+        dropped after failing too many times in a row or after a class was
+        registered ("deopts") and the number currently learned ("active").
+    """
+    stats = {k: _CAST_STATS[k] for k in (
+        'hits', 'misses', 'specializations', 'deopts')}
+    stats['active'] = sum(1 for v in list(_CAST_SPECIALIZATIONS.values()) if v)
+    return stats
+
+
+def _cast_specialized(key, obj):
+    # type: (Optional[tuple], Any) -> Any
+    """Cast a value with the candidate learned for its type and the type.
+
+    Args:
+        key: The key returned by _get_specialization_key, or None.
+        obj: The value to cast.
+
+    Returns:
+        The cast value, or _NOT_SPECIALIZED if no candidate was learned for
+        the key or the learned candidate failed.
+    """
+    specialization = _CAST_SPECIALIZATIONS.get(key) if key else None
+    if not specialization:
+        return _NOT_SPECIALIZED
+    candidate, _, token = specialization
+    if token != _get_abc_cache_token():  # A class was registered with an ABC.
+        _CAST_SPECIALIZATIONS.pop(key, None)
+        _CAST_STATS['deopts'] += 1
+        return _NOT_SPECIALIZED
+    try:
+        result = obj if candidate is None else candidate(obj)
+    except Exception as e:  # pylint: disable=broad-except
+        if _is_fatal_error(e):
+            raise
+        _deoptimize(key, specialization)
+        return _NOT_SPECIALIZED
+    specialization[1] = 0
+    _CAST_STATS['hits'] += 1
+    return result
+
+
+def _get_specialization_key(tp, obj):
+    # type: (Type, Any) -> Optional[Tuple[type, Type]]
+    """Return the key of the candidate learned for a value and a type.
+
+    Args:
+        tp: The type the value is cast to.
+        obj: The value to cast.
+
+    Returns:
+        A tuple of the type of the value and the type, or None if the type is
+        not hashable.
+    """
+    key = (type(obj), tp)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _specialize(key, tp, candidate, skipped=()):
+    # type: (Optional[tuple], Type, Optional[type], Sequence[Any]) -> None
+    """Learn the candidate that cast a value to a type.
+
+    Args:
+        key: The key returned by _get_specialization_key.
+        tp: The type the value was cast to.
+        candidate: The class that cast the value, or None if the value was
+            returned as is.
+        skipped: The candidates that were tried before the class.
+    """
+    if key is None or key in _CAST_SPECIALIZATIONS:
+        return
+    if not _is_type_determined(tp):
+        specialization = False
+    elif all(inspect.isabstract(t) for t in skipped):
+        specialization = [candidate, 0, _get_abc_cache_token()]
+        _CAST_STATS['specializations'] += 1
+    else:
+        return  # Another value of the same type may be learned instead.
+    if len(_CAST_SPECIALIZATIONS) >= _CAST_SPECIALIZATIONS_SIZE:
+        _CAST_SPECIALIZATIONS.popitem(last=False)
+    _CAST_SPECIALIZATIONS[key] = specialization
+
+
+def _deoptimize(key, specialization):
+    # type: (Tuple[type, Type], List[Any]) -> None
+    """Record that a learned candidate failed, dropping it if it keeps failing.
+
+    Args:
+        key: The key returned by _get_specialization_key.
+        specialization: The learned candidate, the number of times in a row
+            it has failed and the abc cache token when it was learned.
+    """
+    _CAST_STATS['misses'] += 1
+    specialization[1] += 1
+    if specialization[1] >= _CAST_DEOPT_THRESHOLD:
+        _CAST_SPECIALIZATIONS.pop(key, None)
+        _CAST_STATS['deopts'] += 1
+
+
+def _is_type_determined(tp):
+    # type: (Type) -> bool
+    """Determine if only the type of a value decides how it is cast to a type.
+
+    Args:
+        tp: The type the value is cast to.
+
+    Returns:
+        True if the type is a class, or a Union of classes, that is checked
+        with the standard isinstance and is not cast as a string.
+    """
+    if tp in _STRING_TYPES:
+        return False
+    members = _get_args(tp) if _get_origin(tp) in _UNION_TYPES else (tp,)
+    return all(
+        isinstance(t, type) and not _get_origin(t) and
+        t.__module__ != 'typing' and (
+            isinstance(t, abc.ABCMeta) or
+            type(t).__instancecheck__ is type.__instancecheck__)
+        for t in members
     )
 
 
+def _cast_compact(type_, obj):
+    # type: (Type, Any) -> Any
+    """Cast a sequence of ints, floats or bools to a packed buffer.
+
+    Args:
+        type_: The type to cast the object to. The object is only cast if the
+            type has a single int, float or bool argument and is satisfied by
+            an array.array (or a memoryview for bools), and the version of
+            Python supports a packed buffer of the argument.
+        obj: The iterable to cast.
+
+    Returns:
+        An array.array of ints or floats, a memoryview of bools, or None if the
+        object cannot be cast to a packed buffer of the given type.
+    """
+    origin = _get_origin(type_)
+    args = _get_args(type_)
+    if not origin or len(args) != 1:
+        return None
+    try:
+        typecode = _COMPACT_TYPECODES[args[0]]
+    except (KeyError, TypeError):
+        return None
+    compact_type = memoryview if typecode == '?' else array.array
+    if not _is_subclass(compact_type, origin):
+        return None
+    if _get_compact_item_type(obj) is args[0]:
+        return obj
+    items = (cast(args[0], v) for v in obj)
+    try:
+        if compact_type is memoryview:
+            return memoryview(bytearray(items)).cast(typecode)
+        return array.array(typecode, items)
+    except OverflowError:
+        if iter(obj) is obj:
+            six.raise_from(TypeError(
+                'Values of {!r} do not fit in a compact {}.'.format(
+                    obj, type_)), None)
+        return None
+
+
+def _is_compact_instance(obj, type_):
+    # type: (Any, Type) -> bool
+    """Determine if a packed buffer is an instance of a type.
+
+    The type of the items in a packed buffer is known from its typecode, so
+    the items do not need to be checked one by one.
+
+    Args:
+        obj: Any object.
+        type_: The type to check the object instance against.
+
+    Returns:
+        True if the object is an array.array or memoryview, the type has a
+        single argument, and the items of the object are instances of it;
+        otherwise, False.
+    """
+    item_type = _get_compact_item_type(obj)
+    if item_type is None:
+        return False
+    origin = _get_origin(type_)
+    args = _get_args(type_)
+    if not origin or len(args) != 1:
+        return False
+    try:
+        return isinstance(obj, origin) and issubclass(item_type, args[0])
+    except TypeError:
+        return False
+
+
+def _cast_lazy(type_, obj, compact=False):
+    # type: (Type, Any, bool) -> Optional[Iterator[Any]]
+    """Wrap an iterable in an iterator that casts each item when it is pulled.
+
+    Args:
+        type_: The type to cast the object to. The object is only wrapped if
+            the type is an Iterator or Generator, or if the type is an
+            Iterable and the object is an iterator.
+        obj: The iterable to cast.
+        compact: Whether items are cast with compact set. See cast.
+
+    Returns:
+        An iterator of the cast items of the object, or None if the object
+        should be cast eagerly.
+    """
+    origin = _get_origin(type_)
+    args = _get_args(type_)
+    if (not origin or not args or args[0] is Any or
+            isinstance(args[0], TypeVar)):
+        return None
+    origin = getattr(origin, '__extra__', None) or origin
+    if origin is collections_abc.Iterable:
+        try:
+            if iter(obj) is not obj:
+                return None
+        except TypeError:
+            return None
+    elif origin is getattr(collections_abc, 'Generator', None):
+        return _CastGenerator(args[0], obj, compact)
+    elif origin is not collections_abc.Iterator:
+        return None
+    return _CastIterator(args[0], obj, compact)
+
+
+class _CastIterator(six.Iterator):
+    """An iterator that casts each item of an iterable when it is pulled."""
+
+    def __init__(self, type_, obj, compact=False):
+        # type: (Type, Iterable[Any], bool) -> None
+        """Initialize the iterator.
+
+        Args:
+            type_: The type to cast each item to.
+            obj: The iterable containing the items to cast.
+            compact: Whether items are cast with compact set. See cast.
+
+        Raises:
+            TypeError: The object is not iterable.
+        """
+        self._type = type_
+        self._iterator = iter(obj)
+        self._compact = compact
+
+    def __iter__(self):
+        # type: () -> _CastIterator
+        """Return the iterator itself."""
+        return self
+
+    def __next__(self):
+        # type: () -> Any
+        """Return the next item of the iterable cast to the item type."""
+        return cast(self._type, next(self._iterator), self._compact)
+
+
+class _CastGenerator(_CastIterator):
+    """A generator that casts each item of a generator when it is yielded."""
+
+    def __init__(self, type_, obj, compact=False):
+        # type: (Type, Iterable[Any], bool) -> None
+        """Initialize the generator.
+
+        Args:
+            type_: The type to cast each yielded item to.
+            obj: The generator containing the items to cast. Other iterables
+                are wrapped in a generator.
+            compact: Whether items are cast with compact set. See cast.
+
+        Raises:
+            TypeError: The object is not iterable.
+        """
+        if not isinstance(obj, collections_abc.Generator):
+            obj = (v for v in iter(obj))
+        super(_CastGenerator, self).__init__(type_, obj, compact)
+
+    def send(self, value):
+        # type: (Any) -> Any
+        """Send a value to the generator and cast the value it yields."""
+        return cast(self._type, self._iterator.send(value), self._compact)
+
+    def throw(self, *args):
+        # type: (*Any) -> Any
+        """Raise an exception in the generator and cast the value it yields."""
+        return cast(self._type, self._iterator.throw(*args), self._compact)
+
+    def close(self):
+        # type: () -> None
+        """Close the generator."""
+        self._iterator.close()
+
+
+def _get_compact_item_type(obj):
+    # type: (Any) -> Optional[type]
+    """Return the type of the items in a packed buffer.
+
+    Args:
+        obj: Any object.
+
+    Returns:
+        The type of the items if the object is an array.array or a memoryview
+        of a single dimension; otherwise, None.
+    """
+    if isinstance(obj, array.array):
+        return _COMPACT_ITEM_TYPES.get(obj.typecode)
+    if isinstance(obj, memoryview) and obj.ndim == 1:
+        return _COMPACT_ITEM_TYPES.get(obj.format)
+    return None
+
+
 def _get_cast_types(type_):
     # type: (Type) -> List[Union[type, Callable[..., Any]]]
     """Return all type callable type constraints for the given type.
@@ -456,30 +1498,21 @@ def _get_cast_types(type_):
     Returns:
         A list of all callable type constraints for the type.
     """
-    cast_types = [type_] if callable(
-        type_) and type_.__module__ != 'typing' else []
+    cast_types = [type_] if (callable(type_) and
+                             type_.__module__ != 'typing' and
+                             not _get_args(type_)) else []
     if (hasattr(type_, '__constraints__') and
             isinstance(type_.__constraints__, Iterable)):
         cast_types.extend(type_.__constraints__)
-    if (hasattr(type_, '__args__') and
-            isinstance(type_.__args__, Iterable) and
-            not _is_subclass(type_, Mapping)):
-        cast_types.extend(type_.__args__)
-    if hasattr(type_, '_abc_registry'):
-        cast_types.extend(sorted(  # Give list and tuple precedence.
-            type_._abc_registry,
-            key=lambda k: k.__name__,
-            reverse=True))
-    if hasattr(type_, '__extra__') and type_.__extra__:
-        if isinstance(type_.__extra__, type):
-            cast_types.append(type_.__extra__)
-        if hasattr(type_.__extra__, '_abc_registry'):
-            cast_types.extend(sorted(  # Give list and tuple precedence.
-                type_.__extra__._abc_registry,
-                key=lambda k: k.__name__,
-                reverse=True))
-    if hasattr(type_, '__origin__') and type_.__origin__:
-        cast_types.append(type_.__origin__)
+    if not _is_subclass(type_, Iterable):  # Not the items of a container.
+        cast_types.extend(_get_args(type_))
+    if isinstance(type_, abc.ABCMeta):
+        cast_types.extend(_get_abc_cast_types(type_))
+    for base in (getattr(type_, '__extra__', None), _get_origin(type_)):
+        if isinstance(base, type):
+            cast_types.append(base)
+            if isinstance(base, abc.ABCMeta):
+                cast_types.extend(_get_abc_cast_types(base))
     try:
         type_name = vars(type_).get('_name')
         if type_name == 'MutableSequence':
@@ -491,8 +1524,68 @@ def _get_cast_types(type_):
     return cast_types
 
 
-def is_instance(obj, type_):
-    # type: (Any, Type) -> bool
+def _get_abc_cast_types(type_):
+    # type: (abc.ABCMeta) -> Tuple[type, ...]
+    """Return the concrete types that may be used to cast to an abstract type.
+
+    The candidates are computed once per abstract type and cached until a new
+    class is registered with any abstract type.
+
+    Args:
+        type_: The abstract type to find concrete types for.
+
+    Returns:
+        A tuple of the registered and well-known concrete types that are
+        subclasses of the given type.
+    """
+    token = _get_abc_cache_token()
+    try:
+        cached_token, cast_types = _ABC_CAST_TYPES_CACHE[type_]
+        if cached_token == token:
+            return cast_types
+    except (KeyError, TypeError):
+        pass
+    candidates = set(_get_abc_registry(type_))
+    for candidate in _ABC_CAST_TYPES:
+        try:
+            if (candidate is not type_ and issubclass(candidate, type_) and
+                    type_.__subclasshook__(candidate) is NotImplemented):
+                candidates.add(candidate)
+        except TypeError:
+            pass
+    cast_types = tuple(sorted(  # Give list and tuple precedence.
+        candidates,
+        key=lambda k: k.__name__,
+        reverse=True))
+    try:
+        _ABC_CAST_TYPES_CACHE[type_] = (token, cast_types)
+    except TypeError:
+        pass
+    return cast_types
+
+
+def _get_abc_registry(type_):
+    # type: (abc.ABCMeta) -> List[type]
+    """Return the classes explicitly registered with an abstract type.
+
+    Args:
+        type_: The abstract type.
+
+    Returns:
+        A list of the classes registered with the type if the abc
+        implementation allows them to be listed; otherwise, an empty list.
+    """
+    registry = vars(type_).get('_abc_registry')
+    if registry is None and hasattr(abc, '_get_dump'):
+        try:
+            registry = [ref() for ref in abc._get_dump(type_)[0]]
+        except (TypeError, IndexError):
+            registry = None
+    return [t for t in registry or () if isinstance(t, type)]
+
+
+def is_instance(obj, type_, cache=False, check_signature=False):
+    # type: (Any, Type, bool, bool) -> bool
     """Determine if an object is an instance of a type.
 
     In addition to the built-in isinstance, this method will compare against
@@ -501,13 +1594,78 @@ def is_instance(obj, type_):
     Args:
         obj: Any object.
         type_: The type to check the object instance against.
+        cache: If True, the result is cached by the identity of the object if
+            the object is a tuple or frozenset containing only immutable
+            values, so checking the same object again returns immediately.
+            The cache keeps a reference to each object until it is evicted,
+            so only objects of up to 16 KiB in total are cached, and up to
+            4096 objects are kept.
+        check_signature: If True, callables checked against Callable[[...], R]
+            must accept the argument types and return R according to their
+            type hints, including comment type hints. The result is cached per
+            code object and type.
 
     Returns:
         True if the object is an instance of the type; otherwise, False.
+
+    Raises:
+        BudgetExceededError: The active validation_budget was exceeded.
     """
-    if type_ == Any or type_ is ByteString and isinstance(
-            obj, (bytes, bytearray)):
+    budget = getattr(_BUDGETS, 'current', None)
+    if budget is None:
+        return _is_instance(obj, type_, cache, check_signature)
+    budget.enter()
+    try:
+        return _is_instance(obj, type_, cache, check_signature)
+    finally:
+        budget.exit()
+
+
+def _is_instance(obj, type_, cache, check_signature):
+    # type: (Any, Type, bool, bool) -> bool
+    """Determine if an object is an instance of a type. See is_instance."""
+    if cache:
+        return _is_instance_cached(obj, type_, check_signature)
+    if _is_instance_fast(obj, type_):
         return True
+    if _MODERN_TYPING:
+        return _is_instance_generic(obj, type_, check_signature)
+    return _is_instance_legacy(obj, type_, check_signature)
+
+
+def _is_instance_fast(obj, type_):
+    # type: (Any, Type) -> bool
+    """Determine if an object is an instance of a type without its items.
+
+    Args:
+        obj: Any object.
+        type_: The type to check the object instance against.
+
+    Returns:
+        True if the type is Any, the object is a bytes or bytearray checked
+        against ByteString, a validated container of the type, or a packed
+        buffer whose items are instances of the argument of the type; False
+        if the object must be checked against the type as usual.
+    """
+    return (type_ == Any or
+            type_ is ByteString and isinstance(obj, (bytes, bytearray)) or
+            isinstance(obj, _ValidatedContainer) and obj._type == type_ or
+            _is_compact_instance(obj, type_))
+
+
+def _is_instance_legacy(obj, type_, check_signature=False):
+    # type: (Any, Type, bool) -> bool
+    """Determine if an object is an instance of a typing backport type.
+
+    Args:
+        obj: Any object.
+        type_: The type to check the object instance against.
+        check_signature: Whether to check the signatures of callables. See
+            is_instance.
+
+    Returns:
+        True if the object is an instance of the type; otherwise, False.
+    """
     if isinstance(type_, type):
         if hasattr(type_, '__args__') and type_.__args__:
             generic_type = (type_.__origin__ if hasattr(
@@ -524,16 +1682,346 @@ def is_instance(obj, type_):
                     k, v in six.iteritems(obj)
                 )
             if _is_subclass(type_, Iterable):
-                return isinstance(obj, generic_type) and all(
-                    is_instance(v, type_.__args__[0]) for v in obj)
+                if not isinstance(obj, generic_type):
+                    return False
+                if iter(obj) is obj:  # Checking items would consume them.
+                    return True
+                return all(is_instance(v, type_.__args__[0]) for v in obj)
         elif isinstance(obj, type_):
             return True
     args = getattr(type_, '__args__', getattr(type_, '__constraints__', None))
-    return any(is_instance(obj, typ) for typ in args or ())
+    return any(_is_instance(obj, typ, False, check_signature)
+               for typ in args or ())
 
 
-def _cast_iterables(type_, obj):
-    # type: (Type, Any) -> Any
+def _is_instance_generic(obj, type_, check_signature=False):
+    # type: (Any, Type, bool) -> bool
+    """Determine if an object is an instance of a type from the typing module.
+
+    This dispatches on the origin of the type, as returned by get_origin, so
+    it handles the generic aliases of the typing module, the built-in generic
+    types of PEP 585 (e.g. list[int]) and the unions of PEP 604 (e.g.
+    int | None).
+
+    Args:
+        obj: Any object.
+        type_: The type to check the object instance against.
+        check_signature: Whether to check the signatures of callables. See
+            is_instance.
+
+    Returns:
+        True if the object is an instance of the type; otherwise, False.
+    """
+    # The object was counted against the validation_budget by is_instance, so
+    # it is checked against other types without counting it again.
+    check = functools.partial(
+        _is_instance, cache=False, check_signature=check_signature)
+    origin = _get_origin(type_)
+    if origin is None:
+        return _is_instance_unsubscripted(obj, type_, check)
+    args = _get_args(type_)
+    if origin in _UNION_TYPES:
+        return any(check(obj, t) for t in args)
+    if origin in _WRAPPER_TYPES:
+        return not args or check(obj, args[0])
+    if origin is getattr(typing, 'Literal', None):
+        return any(obj == a and type(obj) is type(a) for a in args)
+    if not isinstance(origin, type) or not isinstance(obj, origin):
+        return False
+    if origin is type:
+        return not args or _is_subclass_generic(obj, args[0])
+    if _is_subclass(origin, collections_abc.Callable):
+        return not (check_signature and args) or _is_signature_compatible(
+            obj, type_)
+    if not args:  # Tuple[()] has no arguments in 3.11+, but is not bare.
+        return not obj or not (
+            origin is tuple and getattr(type_, '__args__', None) == ())
+    return _is_instance_container(obj, origin, args, check_signature)
+
+
+def _is_instance_unsubscripted(obj, type_, check):
+    # type: (Any, Type, Callable[[Any, Type], bool]) -> bool
+    """Determine if an object is an instance of a type without an origin.
+
+    Args:
+        obj: Any object.
+        type_: A class, TypeVar or NewType.
+        check: The function used to check the object against the constraints
+            or bound of a TypeVar or the supertype of a NewType.
+
+    Returns:
+        True if the object is an instance of the type; otherwise, False.
+    """
+    if isinstance(type_, type):
+        return isinstance(obj, type_)
+    if isinstance(type_, TypeVar):
+        if type_.__constraints__:
+            return any(check(obj, t) for t in type_.__constraints__)
+        return type_.__bound__ is None or check(obj, type_.__bound__)
+    supertype = getattr(type_, '__supertype__', None)
+    return supertype is not None and check(obj, supertype)
+
+
+def _is_instance_container(obj, origin, args, check_signature=False):
+    # type: (Any, type, Tuple[Any, ...], bool) -> bool
+    """Determine if the items of a container are instances of the arguments.
+
+    Args:
+        obj: An instance of the origin.
+        origin: The unsubscripted type of the container.
+        args: The type arguments of the container.
+        check_signature: Whether to check the signatures of callables. See
+            is_instance.
+
+    Returns:
+        True if the items of the object are instances of the arguments, or the
+        origin is not a container type; otherwise, False.
+    """
+    check = is_instance if not check_signature else functools.partial(
+        is_instance, check_signature=True)
+    if issubclass(origin, tuple):
+        if len(args) == 2 and args[1] is Ellipsis:
+            return all(check(v, args[0]) for v in obj)
+        if args == ((),):
+            return not obj
+        return len(obj) == len(args) and all(
+            check(v, t) for t, v in zip(args, obj))
+    if issubclass(origin, Mapping) and len(args) == 2:
+        return all(check(k, args[0]) and check(v, args[1])
+                   for k, v in six.iteritems(obj))
+    if issubclass(origin, Iterable):
+        if iter(obj) is obj:  # Checking items would consume them.
+            return True
+        return all(check(v, args[0]) for v in obj)
+    return True
+
+
+def _is_signature_compatible(obj, type_):
+    # type: (Callable[..., Any], Type) -> bool
+    """Determine if a callable can be called as described by a Callable type.
+
+    The result is cached per code object of the callable and type, and reused
+    while the callable has the same annotations and defaults. Callables
+    without a code object, such as built-in functions, are not checked.
+
+    Args:
+        obj: A callable object.
+        type_: A subscripted Callable type.
+
+    Returns:
+        True if the callable accepts the argument types of the Callable type
+        and returns its return type according to the type hints of the
+        callable; otherwise, False.
+    """
+    func = getattr(obj, '__func__', obj)
+    bound = func is not obj
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return True
+    key = (type_, bound)
+    state = tuple(getattr(func, name, None) for name in (
+        '__annotations__', '__defaults__', '__kwdefaults__'))
+    try:
+        cached_state, result = _SIGNATURE_CACHE[code][key]
+        if all(a is b for a, b in zip(cached_state, state)):
+            return result
+    except KeyError:
+        pass
+    except TypeError:
+        return _check_signature(func, bound, type_)
+    result = _check_signature(func, bound, type_)
+    _SIGNATURE_CACHE.setdefault(code, {})[key] = (state, result)
+    return result
+
+
+def _check_signature(func, bound, type_):
+    # type: (Callable[..., Any], bool, Type) -> bool
+    """Determine if a function can be called as described by a Callable type.
+
+    Args:
+        func: A function.
+        bound: Whether the first parameter of the function is bound.
+        type_: A subscripted Callable type.
+
+    Returns:
+        True if the function is compatible with the Callable type; otherwise,
+        False.
+    """
+    param_types, return_type = _get_args(type_)
+    try:
+        hints = get_type_hints(func)
+    except (NameError, SyntaxError, TypeError):
+        hints = {}
+    if 'return' in hints and not _is_type_compatible(
+            hints['return'], return_type):
+        return False
+    variadic = _CONCATENATE is not None and (
+        _get_origin(param_types) is _CONCATENATE)
+    if variadic:
+        param_types = _get_args(param_types)[:-1]
+    elif not isinstance(param_types, (list, tuple)):
+        return True  # Ellipsis or a ParamSpec accepts any parameters.
+    spec = getattr(inspect, 'get{}argspec'.format('full' if six.PY3 else ''))(
+        func)
+    params = spec.args[1:] if bound else spec.args
+    if not _accepts_param_count(spec, params, len(param_types), variadic):
+        return False
+    for i, param_type in enumerate(param_types):
+        name = params[i] if i < len(params) else spec.varargs
+        if name in hints and not _is_type_compatible(param_type, hints[name]):
+            return False
+    return True
+
+
+def _accepts_param_count(spec, params, count, variadic):
+    # type: (Any, List[str], int, bool) -> bool
+    """Determine if a function accepts a number of positional arguments.
+
+    Args:
+        spec: The argspec of the function.
+        params: The names of the positional parameters of the function that
+            are not bound.
+        count: The number of positional arguments.
+        variadic: Whether any other arguments may be passed after them, as for
+            Concatenate[X, P].
+
+    Returns:
+        True if the function can be called with the arguments; otherwise,
+        False.
+    """
+    if count > len(params) and not spec.varargs:
+        return False
+    if variadic:
+        return True
+    kwonly = set(getattr(spec, 'kwonlyargs', ()))
+    kwonly.difference_update(getattr(spec, 'kwonlydefaults', None) or ())
+    return not kwonly and count >= len(params) - len(spec.defaults or ())
+
+
+def _is_type_compatible(type_, expected):
+    # type: (Any, Any) -> bool
+    """Determine if the values of a type may be used where another is expected.
+
+    This is a lenient check: types that cannot be compared, such as forward
+    references, are considered compatible, and type arguments are compared
+    covariantly.
+
+    Args:
+        type_: The type of the values.
+        expected: The expected type.
+
+    Returns:
+        True if the type is compatible with the expected type; otherwise,
+        False.
+    """
+    if (type_ is Any or expected is Any or type_ == expected or
+            isinstance(type_, TypeVar) or isinstance(expected, TypeVar)):
+        return True
+    type_ = type(None) if type_ is None else type_
+    expected = type(None) if expected is None else expected
+    if _get_origin(type_) in _UNION_TYPES:
+        return all(_is_type_compatible(t, expected) for t in _get_args(type_))
+    if _get_origin(expected) in _UNION_TYPES:
+        return any(_is_type_compatible(type_, t) for t in _get_args(expected))
+    cls = _get_origin(type_) or type_
+    expected_cls = _get_origin(expected) or expected
+    if not isinstance(cls, type) or not isinstance(expected_cls, type):
+        return True
+    if not (issubclass(cls, expected_cls) or
+            expected_cls in _NUMERIC_PROMOTIONS.get(cls, ())):
+        return False
+    args = _get_args(type_)
+    expected_args = _get_args(expected)
+    if len(args) != len(expected_args):
+        return True
+    return all(_is_type_compatible(a, e) if not isinstance(a, list) else True
+               for a, e in zip(args, expected_args))
+
+
+def _is_subclass_generic(type_, class_or_type):
+    # type: (Any, Any) -> bool
+    """Determine if a class is a subclass of the argument of Type[...].
+
+    Args:
+        type_: The class that may be a subclass.
+        class_or_type: A class, Any, a TypeVar or a union of classes.
+
+    Returns:
+        True if the class is a subclass of the given type; otherwise, False.
+    """
+    if class_or_type is Any or isinstance(class_or_type, TypeVar):
+        return True
+    if _get_origin(class_or_type) in _UNION_TYPES:
+        return any(_is_subclass_generic(type_, t)
+                   for t in _get_args(class_or_type))
+    return _is_subclass(type_, class_or_type)
+
+
+def _is_instance_cached(obj, type_, check_signature):
+    # type: (Any, Type, bool) -> bool
+    """Determine if an object is an instance of a type, caching the result.
+
+    Each cache entry holds a reference to the object, so the id of the object
+    cannot be reused by another object while the entry exists. The cache only
+    holds a limited number of entries.
+
+    Args:
+        obj: Any object.
+        type_: The type to check the object instance against.
+        check_signature: Whether to check the signatures of callables. See
+            is_instance.
+
+    Returns:
+        True if the object is an instance of the type; otherwise, False.
+    """
+    try:
+        key = (id(obj), type_, check_signature)
+        return _INSTANCE_CACHE[key][1]
+    except KeyError:
+        pass
+    except TypeError:
+        return _is_instance(obj, type_, False, check_signature)
+    result = _is_instance(obj, type_, False, check_signature)
+    if isinstance(obj, (tuple, frozenset)) and _is_cacheable(obj):
+        _INSTANCE_CACHE[key] = (obj, result)
+        while len(_INSTANCE_CACHE) > _INSTANCE_CACHE_SIZE:
+            try:
+                _INSTANCE_CACHE.popitem(last=False)
+            except KeyError:
+                break
+    return result
+
+
+def _is_cacheable(obj):
+    # type: (Any) -> bool
+    """Determine if an object is deeply immutable and small enough to cache.
+
+    Args:
+        obj: Any object.
+
+    Returns:
+        True if the object is an instance of an immutable built-in type, or a
+        tuple or frozenset that contains only such objects, and the object
+        and the values it contains use at most _INSTANCE_CACHE_OBJECT_SIZE
+        bytes in total; otherwise, False.
+    """
+    size = 0
+    values = [obj]
+    while values:
+        value = values.pop()
+        size += sys.getsizeof(value)
+        if size > _INSTANCE_CACHE_OBJECT_SIZE:
+            return False
+        if type(value) in (tuple, frozenset) or (
+                isinstance(value, tuple) and not hasattr(value, '__dict__')):
+            values.extend(value)
+        elif type(value) not in _IMMUTABLE_TYPES:
+            return False
+    return True
+
+
+def _cast_iterables(type_, obj, compact=False):
+    # type: (Type, Any, bool) -> Any
     """Cast items contained in the object if the object is a container.
 
     Args:
@@ -541,30 +2029,62 @@ def _cast_iterables(type_, obj):
             casting is performed.
         obj: The container object. If the object is not a container, no casting
             is performed.
+        compact: Whether items are cast with compact set. See cast.
 
     Returns:
         An object that can be cast to the given type. This may be either the
-        original object, or a generator that casts all items within the object
-        if the object is a container.
+        original object, or a container of all of the cast items within the
+        object if the object is a container. If the type is one of the
+        containers in _SINGLE_PASS_TYPES, the cast items are added to that
+        container as they are cast instead of to an intermediate list.
     """
-    if not type_.__args__ or TypeVar in (type(t) for t in type_.__args__):
+    args = _get_args(type_)
+    if not args or TypeVar in (type(t) for t in args):
         return obj
-    if _is_subclass(type_, tuple) and Ellipsis not in type_.__args__:
-        if len(obj) == len(type_.__args__):
-            return [cast(typ, val) for typ, val in zip(type_.__args__, obj)]
+    container_type = _get_container_type(type_)
+    if _is_subclass(type_, tuple) and Ellipsis not in args:
+        if len(obj) == len(args):
+            return (container_type or list)(
+                cast(typ, val, compact) for typ, val in zip(args, obj))
         raise TypeError(
             'The number of elements [{}] does not match the type {}'.format(
                 len(obj), repr(type_)))
-    if _is_subclass(type_, Mapping):
-        return {
-            cast(type_.__args__[0], k): cast(type_.__args__[1], v)
+    if _is_subclass(type_, Mapping) and len(args) == 1 and isinstance(
+            obj, Mapping):  # Only the keys have a type, e.g. Counter[str].
+        return {cast(args[0], k, compact): v for k, v in six.iteritems(obj)}
+    if _is_subclass(type_, Mapping) and len(args) == 2:
+        if container_type in (None, dict):
+            return {
+                cast(args[0], k, compact): cast(args[1], v, compact)
+                for k, v in six.iteritems(obj)
+            }
+        return container_type(
+            (cast(args[0], k, compact), cast(args[1], v, compact))
             for k, v in six.iteritems(obj)
-        }
+        )
     if _is_subclass(type_, Iterable):
-        return [cast(type_.__args__[0], v) for v in obj]
+        if container_type in (None, list):
+            return [cast(args[0], v, compact) for v in obj]
+        return container_type(cast(args[0], v, compact) for v in obj)
     return obj
 
 
+def _get_container_type(type_):
+    # type: (Type) -> Optional[type]
+    """Return the class the items of a container type are cast directly into.
+
+    Args:
+        type_: The container type, e.g. Set[int].
+
+    Returns:
+        The unsubscripted class of the type if it is in _SINGLE_PASS_TYPES,
+        otherwise None.
+    """
+    origin = _get_origin(type_)
+    origin = getattr(origin, '__extra__', None) or origin
+    return origin if origin in _SINGLE_PASS_TYPES else None
+
+
 def _cast_string(type_, obj):
     # type: (Type, Any) -> Any
     """Cast the object to a string type.
@@ -604,7 +2124,8 @@ def _is_subclass(type_, class_or_tuple):
     # type: (Type, Union[Type, Tuple]) -> bool
     """Determine if the type is a subclass of the given class or classes.
 
-    This takes __origin__ classes into consideration and does not raise.
+    This takes the origins of generic types into consideration and does not
+    raise.
 
     Args:
         type_: The type that may be a subclass.
@@ -618,9 +2139,10 @@ def _is_subclass(type_, class_or_tuple):
         return issubclass(type_, class_or_tuple)
     except (TypeError, AttributeError):
         pass
-    if hasattr(type_, '__origin__') and type_.__origin__:
+    origin = _get_origin(type_)
+    if origin:
         try:
-            return issubclass(type_.__origin__, class_or_tuple)
+            return issubclass(origin, class_or_tuple)
         except (TypeError, AttributeError):
             pass
     return False
@@ -641,3 +2163,409 @@ def eval_type(type_, globalns=None, localns=None):
     if isinstance(type_, six.string_types):
         type_ = ForwardRef(type_)
     return _eval_type(type_, globalns, localns)
+
+
+def validated(tp, obj):
+    # type: (Type[_T], Any) -> _T
+    """Return a copy of a container that is validated as it changes.
+
+    The items of the object are validated once. Afterwards, only the items
+    added or replaced by each change are validated, and is_instance of the
+    copy against the given type returns without checking any items. Items
+    that are themselves mutable are not tracked; changes made to them are not
+    validated.
+
+    Args:
+        tp: The type of the container, e.g. List[int] or Dict[str, Any].
+        obj: A mapping, set or iterable of the items of the container.
+
+    Returns:
+        A list, dict or set of the items of the object that validates items as
+        they are added.
+
+    Raises:
+        TypeError: The object is not an instance of the given type, or the
+            type cannot be satisfied by a list, dict or set.
+    """
+    origin = _get_origin(tp) or tp
+    if isinstance(obj, Mapping):
+        container = _ValidatedDict
+    elif isinstance(obj, collections_abc.Set):
+        container = _ValidatedSet
+    else:
+        container = _ValidatedList
+    if not _is_subclass(container, origin):
+        raise TypeError('Cannot create a validated {} for {!r}.'.format(
+            container.__bases__[-1].__name__, tp))
+    return container(tp, obj)
+
+
+class _ValidatedContainer(object):
+    """A base class for containers that validate items as they are added."""
+
+    def __init__(self, tp, obj):
+        # type: (Type, Any) -> None
+        """Validate and store the items of the container.
+
+        Args:
+            tp: The type of the container.
+            obj: The items of the container.
+
+        Raises:
+            TypeError: An item is not an instance of its type.
+        """
+        args = _get_args(tp)
+        self._type = tp
+        self._item_types = tuple(
+            a if not isinstance(a, TypeVar) else Any for a in args) or (Any,)
+        super(_ValidatedContainer, self).__init__(obj)
+        for item in self._iter_items(self):
+            self._validate(item)
+
+    def __reduce__(self):
+        """Recreate the container, and its type, when copied or pickled."""
+        return type(self), (self._type, type(self).__bases__[-1](self))
+
+    @staticmethod
+    def _iter_items(obj):
+        # type: (Any) -> Iterable[Any]
+        """Return the items of the object to validate."""
+        return obj
+
+    def _validate(self, item, index=0):
+        # type: (Any, int) -> Any
+        """Validate an item of the container.
+
+        Args:
+            item: The item to validate.
+            index: The index of the type argument to validate against.
+
+        Returns:
+            The item.
+
+        Raises:
+            TypeError: The item is not an instance of its type.
+        """
+        type_ = self._item_types[min(index, len(self._item_types) - 1)]
+        if not is_instance(item, type_):
+            raise TypeError('{!r} is not an instance of {!r}.'.format(
+                item, type_))
+        return item
+
+    def _validate_all(self, items):
+        # type: (Iterable[Any]) -> List[Any]
+        """Validate the items and return them as a list."""
+        return [self._validate(item) for item in items]
+
+
+class _ValidatedList(_ValidatedContainer, list):
+    """A list that validates items as they are added."""
+
+    def __setitem__(self, index, value):
+        """Validate and set the item or slice."""
+        if isinstance(index, slice):
+            value = self._validate_all(value)
+        else:
+            self._validate(value)
+        super(_ValidatedList, self).__setitem__(index, value)
+
+    def __iadd__(self, other):
+        """Validate and add the items."""
+        return super(_ValidatedList, self).__iadd__(self._validate_all(other))
+
+    def append(self, value):
+        """Validate and append the item."""
+        super(_ValidatedList, self).append(self._validate(value))
+
+    def extend(self, values):
+        """Validate and append the items."""
+        super(_ValidatedList, self).extend(self._validate_all(values))
+
+    def insert(self, index, value):
+        """Validate and insert the item."""
+        super(_ValidatedList, self).insert(index, self._validate(value))
+
+
+class _ValidatedSet(_ValidatedContainer, set):
+    """A set that validates items as they are added."""
+
+    def __ior__(self, other):
+        """Validate and add the items."""
+        return super(_ValidatedSet, self).__ior__(
+            set(self._validate_all(other)))
+
+    def __ixor__(self, other):
+        """Validate and toggle the items."""
+        return super(_ValidatedSet, self).__ixor__(
+            set(self._validate_all(other)))
+
+    def add(self, value):
+        """Validate and add the item."""
+        super(_ValidatedSet, self).add(self._validate(value))
+
+    def update(self, *others):
+        """Validate and add the items."""
+        super(_ValidatedSet, self).update(
+            *(self._validate_all(other) for other in others))
+
+    def symmetric_difference_update(self, other):
+        """Validate and toggle the items."""
+        super(_ValidatedSet, self).symmetric_difference_update(
+            self._validate_all(other))
+
+
+class _ValidatedDict(_ValidatedContainer, dict):
+    """A dict that validates keys and values as they are set."""
+
+    @staticmethod
+    def _iter_items(obj):
+        # type: (Any) -> Iterable[Any]
+        """Return the keys and values of the dict to validate."""
+        return six.iteritems(obj)
+
+    def _validate(self, item, index=0):
+        # type: (Any, int) -> Any
+        """Validate a (key, value) pair of the dict."""
+        key, value = item
+        super(_ValidatedDict, self)._validate(key, 0)
+        super(_ValidatedDict, self)._validate(value, 1)
+        return item
+
+    def __setitem__(self, key, value):
+        """Validate and set the item."""
+        self._validate((key, value))
+        super(_ValidatedDict, self).__setitem__(key, value)
+
+    def __ior__(self, other):
+        """Validate and set the items."""
+        self.update(other)
+        return self
+
+    @classmethod
+    def fromkeys(cls, iterable, value=None):
+        """Return a plain dict with the given keys."""
+        return dict.fromkeys(iterable, value)
+
+    def setdefault(self, key, default=None):
+        """Validate and set the item if the key is not in the dict."""
+        if key not in self:
+            self._validate((key, default))
+        return super(_ValidatedDict, self).setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        """Validate and set the items."""
+        items = dict(*args, **kwargs)
+        self._validate_all(six.iteritems(items))
+        super(_ValidatedDict, self).update(items)
+
+
+@contextlib.contextmanager
+def validation_budget(max_depth=None, max_items=None, timeout=None):
+    # type: (Optional[int], Optional[int], Optional[float]) -> Iterator[None]
+    """Limit the resources used by is_instance and cast in a block of code.
+
+    Each value that is checked or cast, including the items of containers,
+    counts as one item. The limits apply to all calls made in the block by the
+    current thread, and nested budgets replace the outer budget.
+
+    Args:
+        max_depth: The maximum depth of nested values. A value that is not
+            in a container has a depth of 1, whether it is checked or cast.
+        max_items: The maximum number of values checked or cast in total.
+        timeout: The maximum number of seconds spent in the block.
+
+    Raises:
+        BudgetExceededError: A limit was exceeded in the block.
+    """
+    previous = getattr(_BUDGETS, 'current', None)
+    _BUDGETS.current = _Budget(max_depth, max_items, timeout)
+    try:
+        yield
+    finally:
+        _BUDGETS.current = previous
+
+
+class BudgetExceededError(Exception):
+    """An error raised when the limits of a validation_budget are exceeded."""
+
+
+class _Budget(object):
+    """The limits and usage of a validation_budget."""
+
+    def __init__(self, max_depth, max_items, timeout):
+        # type: (Optional[int], Optional[int], Optional[float]) -> None
+        """Initialize the budget.
+
+        Args:
+            max_depth: The maximum depth of nested values.
+            max_items: The maximum number of values checked or cast in total.
+            timeout: The maximum number of seconds the budget is active.
+        """
+        self.max_depth = max_depth
+        self.max_items = max_items
+        self.deadline = None if timeout is None else _monotonic() + timeout
+        self.depth = 0
+        self.items = 0
+
+    def enter(self):
+        # type: () -> None
+        """Count a value that is checked or cast and one level of depth."""
+        self.depth += 1
+        self.items += 1
+        if self.max_depth is not None and self.depth > self.max_depth:
+            self.depth -= 1
+            raise BudgetExceededError(
+                'Maximum depth of {} exceeded.'.format(self.max_depth))
+        if self.max_items is not None and self.items > self.max_items:
+            self.depth -= 1
+            raise BudgetExceededError(
+                'Maximum of {} items exceeded.'.format(self.max_items))
+        if self.deadline is not None and _monotonic() > self.deadline:
+            self.depth -= 1
+            raise BudgetExceededError('Timeout exceeded.')
+
+    def exit(self):
+        # type: () -> None
+        """Leave one level of depth."""
+        self.depth -= 1
+
+
+def dump_type_plans(objs, fp):
+    # type: (Iterable[Any], IO[bytes]) -> None
+    """Write the type hints parsed from the source of the objects to a file.
+
+    Parsing type hint comments requires reading and tokenizing source code. In
+    pre-fork or multiprocessing deployments, the parsed type hints can be
+    written once and loaded by each worker with load_type_plans instead.
+
+    Only functions and classes that can be imported by their qualified name
+    and that have a source file are written. The base classes of each class
+    are written as well.
+
+    Args:
+        objs: The functions, methods and classes to write the type hints of.
+        fp: A binary file object to write to.
+    """
+    plans = {}
+    for obj in objs:
+        obj = getattr(obj, '__func__', obj)
+        for target in (obj.__mro__ if isinstance(obj, type) else (obj,)):
+            key = _get_type_plan_key(target)
+            if key is None or key in plans:
+                continue
+            fingerprint = _get_source_fingerprint(target)
+            if fingerprint is None:
+                continue
+            if isinstance(target, type):
+                if vars(target).get('__annotations__'):
+                    continue
+                hints = _get_own_class_type_hints(target)
+            else:
+                hints = _get_func_type_comments(target)
+            plans[key] = (fingerprint, hints)
+    pickle.dump((_TYPE_PLANS_VERSION, plans), fp, 2)
+
+
+def load_type_plans(fp, strict=False):
+    # type: (IO[bytes], bool) -> List[str]
+    """Load type hints written by dump_type_plans.
+
+    Each function and class is verified against the running code before its
+    type hints are used. Objects that can no longer be imported or whose
+    source file has changed since the type hints were written are skipped and
+    will be parsed from source as usual.
+
+    Args:
+        fp: A binary file object to read from.
+        strict: If True, raise an error instead of skipping objects that do not
+            match the running code.
+
+    Returns:
+        A list of the qualified names of the objects that were skipped.
+
+    Raises:
+        ValueError: The file was written by an incompatible version of
+            typingplus, or strict is True and the file does not match the
+            running code.
+    """
+    version, plans = pickle.load(fp)
+    if version != _TYPE_PLANS_VERSION:
+        raise ValueError(
+            'Unsupported type plans version: {}'.format(version))
+    stale = []
+    for key, (fingerprint, hints) in six.iteritems(plans):
+        obj = _resolve_type_plan_key(key)
+        if obj is None or _get_source_fingerprint(obj) != fingerprint:
+            stale.append('{}:{}'.format(*key))
+        elif isinstance(obj, type):
+            _CLASS_HINTS_CACHE[obj] = hints
+        else:
+            _FUNC_COMMENTS_CACHE[obj.__code__] = hints
+    if strict and stale:
+        raise ValueError('Type plans do not match the running code: {}'.format(
+            ', '.join(sorted(stale))))
+    return stale
+
+
+def _get_type_plan_key(obj):
+    # type: (Any) -> Optional[Tuple[str, str]]
+    """Return the module and qualified name that identify an object.
+
+    Args:
+        obj: A function or class.
+
+    Returns:
+        A tuple of the module name and qualified name of the object, or None if
+        the object cannot be imported by that name.
+    """
+    if not isinstance(obj, (type, types.FunctionType)):
+        return None
+    key = (obj.__module__, getattr(obj, '__qualname__', obj.__name__))
+    if _resolve_type_plan_key(key) is not obj:
+        return None
+    return key
+
+
+def _resolve_type_plan_key(key):
+    # type: (Tuple[str, str]) -> Any
+    """Import the object identified by a module and qualified name.
+
+    Args:
+        key: A tuple of the module name and qualified name of the object.
+
+    Returns:
+        The object, or None if it cannot be imported.
+    """
+    module_name, qualname = key
+    try:
+        obj = importlib.import_module(module_name)
+        for name in qualname.split('.'):
+            obj = getattr(obj, name)
+    except (ImportError, AttributeError):
+        return None
+    obj = getattr(obj, '__func__', obj)
+    if not isinstance(obj, (type, types.FunctionType)):
+        return None
+    return obj
+
+
+def _get_source_fingerprint(obj):
+    # type: (Any) -> Optional[Tuple[Any, ...]]
+    """Return a value that changes whenever the source of an object changes.
+
+    Args:
+        obj: A function or class.
+
+    Returns:
+        A tuple of the path, modification time and size of the source file of
+        the object and, for functions, the first line of the function; or None
+        if the object has no source file.
+    """
+    try:
+        filename = inspect.getsourcefile(obj)
+        stat = os.stat(filename)
+    except (TypeError, OSError):
+        return None
+    code = getattr(obj, '__code__', None)
+    return (os.path.abspath(filename), stat.st_mtime, stat.st_size,
+            getattr(code, 'co_firstlineno', None))